@@ -1,86 +1,221 @@
-from datetime import datetime
+import argparse
+from contextlib import ExitStack
+import os
 import time
-import uuid
 from mp_api.client import MPRester
 from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, Distance, PointStruct
-from utils.data_formatting import format_summary_doc
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from utils.collection_config import create_collection, create_payload_indexes, has_sparse_vectors, update_collection_storage
+from utils.embedding_cache import EmbeddingCache
 from utils.embeddings import CustomEmbeddings
+from utils.embedding_pool import EmbeddingWorkerPool
 from utils.embedding_models import get_matscibert
-from utils.qdrant_client import get_qdrant_client
+from utils.ingestion import IngestionCheckpoint, download_summary_docs, fit_projection_on_sample, ingest, start_format_pool, stream_embedded_batches
+from utils.ingestion_metrics import IngestionMetrics
+from utils.text_splitting import SectionTokenSplitter
+from utils.mp_snapshot import load_summary_snapshot, save_summary_snapshot
+from utils.qdrant_client import get_qdrant_client, is_embedded_qdrant
+from utils.retrieval_cache import write_collection_version
+from utils.vector_projection import PCAProjection
+from utils.vector_snapshot import export_vector_snapshot, load_vector_snapshot, read_snapshot_projection, read_vector_snapshot
 import config
 
-if (input('WARNING: This operation will overwrite all existing embeddings. '
-          'This means all previously stored vector embeddings and their '
-          'associated data will be permanently deleted and replaced with new embeddings. \n\n'
-          'Are you sure you want to proceed? (Y/N): ').strip().lower() != "y"):
+# number of points per upsert, also the unit of work recorded in the checkpoint
+UPSERT_BATCH_SIZE = 1600
+# number of summary docs fetched from the MP API per request
+DOWNLOAD_PAGE_SIZE = 1000
+# concurrent upload workers, and how many batches may wait for Qdrant before embedding is throttled
+UPLOAD_WORKERS = 4
+MAX_PENDING_UPLOADS = 8
+# processes formatting and normalizing summary docs, and docs handed to a process per task
+FORMAT_WORKERS = os.cpu_count()
+FORMAT_CHUNK_SIZE = 16
+# parallel upload processes used by --load-vectors
+LOAD_VECTORS_PARALLEL = 4
+# chunks embedded to fit the vector projection, when VECTOR_PROJECTION_DIM is set
+PROJECTION_SAMPLE_SIZE = 4800
+
+MATERIALS_COLLECTION_NAME = "materials"
+
+parser = argparse.ArgumentParser(
+    description="Fetch summary docs from the Material Project API and index them in Qdrant")
+parser.add_argument("--recreate", action="store_true",
+                    help="drop the collection and discard the checkpoint before ingesting")
+parser.add_argument("--from-snapshot", nargs="?", const=config.SUMMARY_SNAPSHOT_PATH, metavar="PATH",
+                    help="rebuild the index from a local snapshot of summary docs instead of the MP API "
+                    f"(default: {config.SUMMARY_SNAPSHOT_PATH})")
+parser.add_argument("--export-vectors", metavar="DIR",
+                    help="write the embeddings to a memory-mapped vector snapshot in DIR instead of Qdrant")
+parser.add_argument("--load-vectors", metavar="DIR",
+                    help="load a vector snapshot written by --export-vectors into Qdrant, without embedding anything")
+args = parser.parse_args()
+
+
+def prepare_collection(qdrant_client: QdrantClient, vector_size: int, checkpoint: IngestionCheckpoint = None):
+    if args.recreate:
+        if qdrant_client.collection_exists(collection_name=MATERIALS_COLLECTION_NAME):
+            qdrant_client.delete_collection(
+                collection_name=MATERIALS_COLLECTION_NAME)
+        if checkpoint is not None:
+            checkpoint.reset()
+    elif checkpoint is not None and len(checkpoint) and not qdrant_client.collection_exists(collection_name=MATERIALS_COLLECTION_NAME):
+        # checkpoint refers to points that no longer exist
+        print("Collection is missing, discarding stale checkpoint.")
+        checkpoint.reset()
+
+    if not qdrant_client.collection_exists(collection_name=MATERIALS_COLLECTION_NAME):
+        create_collection(qdrant_client, MATERIALS_COLLECTION_NAME, vector_size)
+    elif qdrant_client.get_collection(MATERIALS_COLLECTION_NAME).config.params.vectors.size != vector_size:
+        print(f"The collection does not hold {vector_size}-dimensional vectors, run with --recreate to rebuild it.")
+        exit(1)
+    elif config.HYBRID_SEARCH and not has_sparse_vectors(qdrant_client, MATERIALS_COLLECTION_NAME):
+        # sparse vectors cannot be added to an existing collection
+        print("The collection has no sparse vectors for hybrid search, run with --recreate to rebuild it "
+              "or set HYBRID_SEARCH=false to keep refreshing the dense vectors only.")
+        exit(1)
+    else:
+        # quantization and on-disk settings can change without re-ingesting
+        update_collection_storage(qdrant_client, MATERIALS_COLLECTION_NAME)
+        # collections created before an index was added
+        create_payload_indexes(qdrant_client, MATERIALS_COLLECTION_NAME)
+    # the chatbot drops cached search results of the previous contents, and again once the run is complete
+    write_collection_version(qdrant_client, MATERIALS_COLLECTION_NAME)
+
+
+def prepare_projection(embedding_model: CustomEmbeddings, doc_pages, text_splitter):
+    """loads the projection of the stored vectors into `embedding_model`, fitting it on the first chunks when there is none"""
+    if not config.VECTOR_PROJECTION_DIM:
+        return doc_pages
+    if args.recreate and os.path.exists(config.VECTOR_PROJECTION_PATH):
+        os.remove(config.VECTOR_PROJECTION_PATH)
+    if os.path.exists(config.VECTOR_PROJECTION_PATH):
+        projection = PCAProjection.load(config.VECTOR_PROJECTION_PATH)
+        if projection.dimension != config.VECTOR_PROJECTION_DIM:
+            print(f"The saved projection has {projection.dimension} dimensions, run with --recreate to refit it.")
+            exit(1)
+    else:
+        projection, doc_pages = fit_projection_on_sample(
+            doc_pages, embedding_model, text_splitter, config.VECTOR_PROJECTION_DIM, PROJECTION_SAMPLE_SIZE)
+        projection.save(config.VECTOR_PROJECTION_PATH)
+    embedding_model.set_projection(projection)
+    return doc_pages
+
+
+def restore_projection(snapshot_directory: str, vector_size: int):
+    """saves the projection of a vector snapshot to VECTOR_PROJECTION_PATH, where the chatbot loads it from"""
+    projection = read_snapshot_projection(snapshot_directory)
+    if projection is None:
+        if not config.VECTOR_PROJECTION_DIM:
+            return
+        # snapshots exported before the projection was stored along with the vectors
+        if os.path.exists(config.VECTOR_PROJECTION_PATH) and PCAProjection.load(config.VECTOR_PROJECTION_PATH).dimension == vector_size:
+            print(f"The snapshot holds no projection, keeping {config.VECTOR_PROJECTION_PATH}.")
+            return
+        print(f"The snapshot holds no {config.VECTOR_PROJECTION_DIM}-dimensional projection, unset VECTOR_PROJECTION_DIM "
+              "to load full-width vectors or export the snapshot again.")
+        exit(1)
+    if projection.dimension != config.VECTOR_PROJECTION_DIM:
+        print(f"The snapshot vectors are projected to {projection.dimension} dimensions, "
+              f"set VECTOR_PROJECTION_DIM={projection.dimension} for the extractor and the chatbot.")
+        exit(1)
+    projection.save(config.VECTOR_PROJECTION_PATH)
+
+
+def get_doc_pages(stack: ExitStack):
+    if args.from_snapshot:
+        return load_summary_snapshot(args.from_snapshot)
+    # every download is also saved, so later runs can re-index with --from-snapshot
+    mpr = stack.enter_context(MPRester(config.MATERIAL_PROJECT_TOKEN))
+    return save_summary_snapshot(
+        download_summary_docs(mpr, page_size=DOWNLOAD_PAGE_SIZE),
+        config.SUMMARY_SNAPSHOT_PATH
+    )
+
+
+if args.recreate and (input('WARNING: This operation will overwrite all existing embeddings. '
+                            'This means all previously stored vector embeddings and their '
+                            'associated data will be permanently deleted and replaced with new embeddings. \n\n'
+                            'Are you sure you want to proceed? (Y/N): ').strip().lower() != "y"):
     print("Operation aborted. No changes have been made.")
     exit(0)
 
-if not config.USE_LOCAL_QDRANT:
+# exporting a vector snapshot does not touch Qdrant
+if not args.export_vectors and not config.USE_LOCAL_QDRANT and not is_embedded_qdrant():
     print("Ensure the system is configured to use a local Qdrant store, as this process can lead to serious side effects.")
     exit(0)
 
-embedding_model = CustomEmbeddings(*get_matscibert())
-
-qdrant_client = get_qdrant_client()
-
-MATERIALS_COLLECTION_NAME = "materials"
-
-if qdrant_client.collection_exists(collection_name=MATERIALS_COLLECTION_NAME):
-    qdrant_client.delete_collection(collection_name=MATERIALS_COLLECTION_NAME)
-
-qdrant_client.create_collection(
-    collection_name=MATERIALS_COLLECTION_NAME,
-    vectors_config=VectorParams(size=768, distance=Distance.COSINE),
-)
-# document model not used because of bug in API
-# https://github.com/materialsproject/api/issues/922
-with MPRester(config.MATERIAL_PROJECT_TOKEN) as mpr:
-    fields_to_include = set(
-        mpr.materials.summary.available_fields) - {"builder_meta", "last_updated", "origins"}
-    material_docs = mpr.materials.summary.search(
-        all_fields=False, fields=[*fields_to_include])
-print("completed downloading documents from the Material Project API")
 start_time = time.perf_counter()
-material_descriptions = [format_summary_doc(doc) for doc in material_docs]
-material_descriptions = [
-    (str(material_id), CustomEmbeddings.normalize_text_with_bert(material_description))
-    for material_id, material_description in material_descriptions
-]
-token_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=2000, chunk_overlap=200)
-
-chunked_documents = [
-    (material_id, description_chunk)
-    for material_id, material_description in material_descriptions
-    for description_chunk in token_splitter.split_text(material_description)
-]
-material_ids, description_chunks = zip(*chunked_documents)
-
-embeddings_generator = embedding_model.stream_embeddings_in_batch(
-    description_chunks)
-for batch_start_idx, batch_end_idx, batch_embeddings in embeddings_generator:
-    batch_material_ids = material_ids[batch_start_idx:batch_end_idx]
-    batch_description_chunks = description_chunks[batch_start_idx:batch_end_idx]
-    points = [
-        PointStruct(
-            id=str(uuid.uuid4()),
-            vector=embedding,
-            payload={
-                "material_id": material_id,
-                "page_content": description_chunk
-            }
-        ) for embedding, material_id, description_chunk in zip(batch_embeddings, batch_material_ids, batch_description_chunks)
-    ]
-    # Add document to Qdrant
-    qdrant_client.upsert(
-        collection_name=MATERIALS_COLLECTION_NAME,
-        points=points
-    )
-    print(f"{datetime.now()}: {len(points)} points inserted to Qdrant.")
+if args.load_vectors:
+    qdrant_client = get_qdrant_client()
+    snapshot_vector_size = read_vector_snapshot(args.load_vectors)[0].shape[1]
+    # the chatbot projects the queries like the loaded vectors
+    restore_projection(args.load_vectors, snapshot_vector_size)
+    with IngestionCheckpoint(config.INGEST_CHECKPOINT_PATH) as checkpoint:
+        prepare_collection(qdrant_client, snapshot_vector_size, checkpoint)
+        load_vector_snapshot(args.load_vectors, qdrant_client, MATERIALS_COLLECTION_NAME,
+                             parallel=LOAD_VECTORS_PARALLEL,
+                             sparse_vectors=has_sparse_vectors(qdrant_client, MATERIALS_COLLECTION_NAME))
+        # the snapshot replaced the chunks of its materials, the committed batches may no longer be stored
+        checkpoint.reset()
+    write_collection_version(qdrant_client, MATERIALS_COLLECTION_NAME)
+else:
+    # forked before the model is loaded, the workers only format and normalize text
+    format_pool = start_format_pool(FORMAT_WORKERS)
+    # forked before the model is loaded as well, every worker loads its own copy
+    embedding_pool = EmbeddingWorkerPool(
+        config.EMBEDDING_WORKERS) if config.EMBEDDING_WORKERS else None
+    metrics = IngestionMetrics()
+    embedding_cache = EmbeddingCache(
+        config.EMBEDDING_CACHE_PATH) if config.EMBEDDING_CACHE_PATH else None
+    tokenizer, model = get_matscibert()
+    embedding_model = CustomEmbeddings(
+        tokenizer, model, cache=embedding_cache, metrics=metrics, worker_pool=embedding_pool)
+    # chunks are whole property sections that fit the MatSciBERT window
+    token_splitter = SectionTokenSplitter(tokenizer)
+    with ExitStack() as stack:
+        stack.enter_context(format_pool)
+        if embedding_pool is not None:
+            stack.enter_context(embedding_pool)
+        # the projection decides the size of the stored vectors, so it is ready before the collection
+        doc_pages = prepare_projection(
+            embedding_model, get_doc_pages(stack), token_splitter)
+        checkpoint = None
+        if not args.export_vectors:
+            qdrant_client = get_qdrant_client()
+            checkpoint = stack.enter_context(
+                IngestionCheckpoint(config.INGEST_CHECKPOINT_PATH))
+            prepare_collection(
+                qdrant_client, embedding_model.dimension, checkpoint)
+        embedded_batches = stream_embedded_batches(
+            doc_pages,
+            embedding_model,
+            token_splitter,
+            checkpoint=checkpoint,
+            batch_size=UPSERT_BATCH_SIZE,
+            format_pool=format_pool,
+            format_chunksize=FORMAT_CHUNK_SIZE,
+            metrics=metrics
+        )
+        if args.export_vectors:
+            export_vector_snapshot(
+                embedded_batches, args.export_vectors, embedding_model.dimension, embedding_model.projection)
+        else:
+            ingest(
+                embedded_batches,
+                qdrant_client,
+                MATERIALS_COLLECTION_NAME,
+                checkpoint,
+                # the embedded Qdrant is not safe for concurrent writes
+                upload_workers=1 if is_embedded_qdrant() else UPLOAD_WORKERS,
+                max_pending_uploads=MAX_PENDING_UPLOADS,
+                metrics=metrics,
+                # dense-only collections created before the sparse vectors were added
+                sparse_vectors=has_sparse_vectors(
+                    qdrant_client, MATERIALS_COLLECTION_NAME)
+            )
+            write_collection_version(qdrant_client, MATERIALS_COLLECTION_NAME)
+    if embedding_cache is not None:
+        embedding_cache.close()
+    print(metrics.report())
 end_time = time.perf_counter()
 time_taken = end_time - start_time
 print(f"Processing took {time_taken:.4f} seconds")
-print(123)
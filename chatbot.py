@@ -7,7 +7,9 @@ from langchain_core.globals import set_verbose
 from utils.prompts import *
 from langgraph.graph import END, StateGraph
 
-from utils.state_graph import GraphState, MatSciStateGraph
+from utils.state_graph import GraphState, MatSciStateGraph, warm_up_retrieval
+# the model loads while the page renders, the first query only waits for what is left
+warm_up_retrieval()
 set_verbose(True)
 format_page_styles(st)
 if 'remote_ollama_url_enabled' not in st.session_state:
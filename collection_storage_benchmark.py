@@ -0,0 +1,85 @@
+import argparse
+import os
+import time
+import numpy as np
+from utils.collection_config import CollectionStorage, create_collection
+from utils.qdrant_client import get_qdrant_client
+from utils.vector_snapshot import PAGE_CONTENT_FILE_NAME, cosine_top_k, load_vector_snapshot, read_vector_snapshot
+import config
+
+# loads a vector snapshot (`api_data_extractor.py --export-vectors DIR`) into a scratch collection
+# with each storage setup and reports the estimated RAM, recall@k against an exact brute-force
+# search and the query latency of each
+
+BENCHMARK_COLLECTION_NAME = "materials_storage_benchmark"
+
+STORAGE_SETUPS = {
+    "baseline": CollectionStorage(),
+    "scalar": CollectionStorage(quantization="scalar"),
+    "scalar+disk": CollectionStorage(quantization="scalar", vectors_on_disk=True, payload_on_disk=True),
+    "scalar+disk-norescore": CollectionStorage(quantization="scalar", vectors_on_disk=True, payload_on_disk=True, rescore=False),
+    "binary": CollectionStorage(quantization="binary"),
+    "binary+disk": CollectionStorage(quantization="binary", vectors_on_disk=True, payload_on_disk=True, oversampling=4.),
+}
+
+parser = argparse.ArgumentParser(
+    description="Compare the estimated RAM and the recall of the collection storage setups on a vector snapshot")
+parser.add_argument("vectors", metavar="DIR",
+                    help="vector snapshot written by api_data_extractor.py --export-vectors")
+parser.add_argument("--queries", type=int, default=200,
+                    help="number of stored vectors used as queries (default: 200)")
+parser.add_argument("-k", type=int, default=10)
+args = parser.parse_args()
+
+
+def wait_until_indexed(qdrant_client, collection_name: str):
+    # quantized vectors are built by the optimizer after the upload
+    while qdrant_client.get_collection(collection_name).status != "green":
+        time.sleep(1)
+
+
+if not config.USE_LOCAL_QDRANT:
+    print("Ensure the system is configured to use a local Qdrant store before running the benchmark.")
+    exit(0)
+
+vectors, payload, _ = read_vector_snapshot(args.vectors)
+point_ids = np.array([point_id.decode("ascii") for point_id in payload["id"]])
+page_content_bytes = os.path.getsize(
+    os.path.join(args.vectors, PAGE_CONTENT_FILE_NAME))
+rng = np.random.default_rng(0)
+query_idxs = rng.choice(len(vectors), size=min(
+    args.queries, len(vectors)), replace=False)
+queries = np.asarray(vectors[query_idxs], dtype=np.float32)
+
+exact_top_k = [set(point_ids[idxs])
+               for idxs in cosine_top_k(vectors, queries, args.k)]
+
+qdrant_client = get_qdrant_client()
+print(f"{'setup':<24}{'est. RAM MB':>12}{f'recall@{args.k}':>12}{'ms/query':>10}")
+for name, storage in STORAGE_SETUPS.items():
+    if qdrant_client.collection_exists(collection_name=BENCHMARK_COLLECTION_NAME):
+        qdrant_client.delete_collection(
+            collection_name=BENCHMARK_COLLECTION_NAME)
+    create_collection(qdrant_client, BENCHMARK_COLLECTION_NAME,
+                      vectors.shape[1], storage)
+    load_vector_snapshot(args.vectors, qdrant_client,
+                         BENCHMARK_COLLECTION_NAME)
+    wait_until_indexed(qdrant_client, BENCHMARK_COLLECTION_NAME)
+    recalls = []
+    start_time = time.perf_counter()
+    for query, exact_ids in zip(queries, exact_top_k):
+        points = qdrant_client.query_points(
+            collection_name=BENCHMARK_COLLECTION_NAME,
+            query=query.tolist(),
+            limit=args.k,
+            search_params=storage.search_params(),
+            with_payload=False
+        ).points
+        recalls.append(len(exact_ids & {point.id for point in points}) / args.k)
+    ms_per_query = (time.perf_counter() - start_time) / len(queries) * 1000
+    ram_bytes = storage.estimated_ram_bytes(len(vectors), vectors.shape[1]) + (
+        0 if storage.payload_on_disk else page_content_bytes)
+    print(f"{name:<24}{ram_bytes / 2 ** 20:>12.1f}{np.mean(recalls):>12.3f}{ms_per_query:>10.2f}")
+qdrant_client.delete_collection(collection_name=BENCHMARK_COLLECTION_NAME)
+print("est. RAM: computed from the vector count and size (1.5x the vectors held in RAM, plus the page "
+      "contents unless the payload is on disk), not measured")
@@ -7,3 +7,75 @@ QDRANT_URL = os.getenv('QDRANT_URL')
 QDRANT_TOKEN = os.getenv('QDRANT_TOKEN')
 MATERIAL_PROJECT_TOKEN = os.getenv('MATERIAL_PROJECT_TOKEN')
 USE_LOCAL_QDRANT = os.getenv('USE_LOCAL_QDRANT', 'false').lower() == "true"
+# runs Qdrant embedded in the process (Qdrant local mode) with its collections stored in this directory,
+# instead of connecting to a Qdrant server. only one process can open the directory at a time
+QDRANT_PATH = os.getenv('QDRANT_PATH', '')
+# records upsert batches already committed, so an interrupted ingestion can resume
+INGEST_CHECKPOINT_PATH = os.getenv(
+    'INGEST_CHECKPOINT_PATH', 'data/ingest_checkpoint.txt')
+# local copy of the downloaded summary docs, used by `api_data_extractor.py --from-snapshot`
+SUMMARY_SNAPSHOT_PATH = os.getenv(
+    'SUMMARY_SNAPSHOT_PATH', 'data/summary_docs.msgpack.gz')
+# persistent embeddings keyed by model name and chunk text, set to an empty value to disable
+EMBEDDING_CACHE_PATH = os.getenv(
+    'EMBEDDING_CACHE_PATH', 'data/embedding_cache.sqlite')
+# pad each batch to its longest text and pool over the attention mask instead of padding to 512 tokens,
+# changes the embeddings, so the collection is re-embedded on the next ingestion after switching. off by
+# default, so deployed chatbots keep embedding queries like the stored vectors were embedded
+EMBEDDING_DYNAMIC_PADDING = os.getenv(
+    'EMBEDDING_DYNAMIC_PADDING', 'false').lower() == "true"
+# CPU inference profile of the embedding models, int8 and bf16 change the embeddings,
+# so the collection is re-embedded on the next ingestion after switching
+EMBEDDING_QUANTIZE_INT8 = os.getenv(
+    'EMBEDDING_QUANTIZE_INT8', 'false').lower() == "true"
+EMBEDDING_BF16 = os.getenv('EMBEDDING_BF16', 'false').lower() == "true"
+# intra-op and inter-op thread counts of torch or ONNX Runtime, 0 keeps their defaults
+TORCH_INTRA_OP_THREADS = int(os.getenv('TORCH_INTRA_OP_THREADS', '0'))
+TORCH_INTER_OP_THREADS = int(os.getenv('TORCH_INTER_OP_THREADS', '0'))
+# runs the embedding models with "torch" or with "onnx" (ONNX Runtime on the CPU, requires the onnxruntime package),
+# the ONNX export of each model is cached in EMBEDDING_ONNX_DIR the first time it is used
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch').lower()
+EMBEDDING_ONNX_DIR = os.getenv('EMBEDDING_ONNX_DIR', 'data/onnx')
+# number of normalized chatbot queries whose embeddings are kept in memory, 0 disables the cache
+QUERY_EMBEDDING_CACHE_SIZE = int(
+    os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '1024'))
+# seconds a cached query embedding stays valid, 0 keeps it until it is evicted
+QUERY_EMBEDDING_CACHE_TTL = float(
+    os.getenv('QUERY_EMBEDDING_CACHE_TTL', '0'))
+# number of worker processes embedding the chunks during ingestion, each with its own model copy
+# and an equal share of the CPU cores, 0 embeds in the extractor process
+EMBEDDING_WORKERS = int(os.getenv('EMBEDDING_WORKERS', '0'))
+# concurrent chatbot queries are embedded together in batches of up to QUERY_BATCH_SIZE queries,
+# a batch waits at most QUERY_BATCH_MAX_WAIT_MS for more queries, 0 or 1 embeds every query on its own
+QUERY_BATCH_SIZE = int(os.getenv('QUERY_BATCH_SIZE', '16'))
+QUERY_BATCH_MAX_WAIT_MS = float(os.getenv('QUERY_BATCH_MAX_WAIT_MS', '5'))
+# storage of the materials collection: QDRANT_QUANTIZATION is "none", "scalar" (int8) or "binary",
+# QDRANT_VECTORS_ON_DISK keeps the original vectors on disk, QDRANT_PAYLOAD_ON_DISK the payload.
+# applied when the extractor creates the collection or runs against an existing one
+QDRANT_QUANTIZATION = os.getenv('QDRANT_QUANTIZATION', 'none').lower()
+QDRANT_QUANTIZATION_ALWAYS_RAM = os.getenv(
+    'QDRANT_QUANTIZATION_ALWAYS_RAM', 'true').lower() == "true"
+QDRANT_VECTORS_ON_DISK = os.getenv(
+    'QDRANT_VECTORS_ON_DISK', 'false').lower() == "true"
+QDRANT_PAYLOAD_ON_DISK = os.getenv(
+    'QDRANT_PAYLOAD_ON_DISK', 'false').lower() == "true"
+# quantized searches rescore QDRANT_OVERSAMPLING * k candidates with the original vectors
+QDRANT_RESCORE = os.getenv('QDRANT_RESCORE', 'true').lower() == "true"
+QDRANT_OVERSAMPLING = float(os.getenv('QDRANT_OVERSAMPLING', '2'))
+# project the stored vectors and the queries onto this many principal components, 0 keeps the full width.
+# the extractor fits the projection on a sample of chunk embeddings and saves it to VECTOR_PROJECTION_PATH,
+# where the chatbot loads it from
+VECTOR_PROJECTION_DIM = int(os.getenv('VECTOR_PROJECTION_DIM', '0'))
+VECTOR_PROJECTION_PATH = os.getenv(
+    'VECTOR_PROJECTION_PATH', 'data/vector_projection.npz')
+# the chatbot fuses the dense MatSciBERT search with a BM25 search over the stored sparse vectors (reciprocal rank fusion),
+# collections created before the sparse vectors were added are searched with the dense vectors only.
+# the extractor only requires the sparse vectors, and so a recreated collection, while this is on
+HYBRID_SEARCH = os.getenv('HYBRID_SEARCH', 'true').lower() == "true"
+# number of searches whose retrieved documents are kept in memory and shared by all chat sessions, 0 disables the cache.
+# entries expire after RETRIEVAL_CACHE_TTL seconds (0 keeps them until evicted), and all of them are dropped once the
+# extractor writes a new collection version, which the chatbot checks every RETRIEVAL_CACHE_VERSION_CHECK_SECONDS
+RETRIEVAL_CACHE_SIZE = int(os.getenv('RETRIEVAL_CACHE_SIZE', '256'))
+RETRIEVAL_CACHE_TTL = float(os.getenv('RETRIEVAL_CACHE_TTL', '600'))
+RETRIEVAL_CACHE_VERSION_CHECK_SECONDS = float(
+    os.getenv('RETRIEVAL_CACHE_VERSION_CHECK_SECONDS', '30'))
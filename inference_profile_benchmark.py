@@ -0,0 +1,52 @@
+import argparse
+import time
+import numpy as np
+from utils.benchmark_corpus import corpus_descriptions
+from utils.embeddings import CustomEmbeddings
+from utils.embedding_models import InferenceProfile, get_matscibert
+
+# embeds a fixed corpus with the fp32 torch model and with each CPU inference profile, and reports
+# the throughput of every profile and how far its embeddings drift from the fp32 baseline
+
+parser = argparse.ArgumentParser(
+    description="Compare the MatSciBERT inference profiles and backends on a synthetic corpus or a summary doc snapshot")
+parser.add_argument("--docs", type=int, default=200,
+                    help="number of docs to embed (default: 200)")
+parser.add_argument("--snapshot", metavar="PATH",
+                    help="take the docs from a summary doc snapshot instead of generating them")
+parser.add_argument("--intra-op-threads", type=int, default=0,
+                    help="intra-op threads for every profile (default: backend default)")
+parser.add_argument("--inter-op-threads", type=int, default=0,
+                    help="inter-op threads for every profile (default: backend default)")
+args = parser.parse_args()
+
+PROFILES = {
+    "fp32": InferenceProfile(),
+    "int8": InferenceProfile(quantize_int8=True),
+    "bf16": InferenceProfile(bf16=True),
+    "onnx": InferenceProfile(backend="onnx"),
+    "onnx-int8": InferenceProfile(backend="onnx", quantize_int8=True),
+}
+
+
+def cosine_similarities(embeddings: np.ndarray, baseline: np.ndarray) -> np.ndarray:
+    return (embeddings * baseline).sum(axis=1) / (
+        np.linalg.norm(embeddings, axis=1) * np.linalg.norm(baseline, axis=1))
+
+
+# whole descriptions are embedded, the few that do not fit the model window are truncated
+texts = corpus_descriptions(args.docs, args.snapshot)
+baseline = None
+print(f"{'profile':<12}{'seconds':>10}{'texts/s':>10}{'mean cos':>12}{'min cos':>12}")
+for name, profile in PROFILES.items():
+    profile = profile._replace(intra_op_threads=args.intra_op_threads,
+                               inter_op_threads=args.inter_op_threads)
+    embedding_model = CustomEmbeddings(*get_matscibert(profile))
+    start_time = time.perf_counter()
+    embeddings = embedding_model.embed_documents_array(texts)
+    seconds = time.perf_counter() - start_time
+    if baseline is None:
+        baseline = embeddings
+    similarities = cosine_similarities(embeddings, baseline)
+    print(f"{name:<12}{seconds:>10.2f}{len(texts) / seconds:>10.1f}"
+          f"{similarities.mean():>12.6f}{similarities.min():>12.6f}")
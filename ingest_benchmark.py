@@ -0,0 +1,73 @@
+import argparse
+from utils.collection_config import create_collection
+from utils.embeddings import CustomEmbeddings
+from utils.embedding_pool import EmbeddingWorkerPool
+from utils.embedding_models import get_matscibert
+from utils.ingestion import ingest, start_format_pool, stream_embedded_batches
+from utils.ingestion_metrics import IngestionMetrics
+from utils.text_splitting import SectionTokenSplitter
+from utils.qdrant_client import get_qdrant_client, is_embedded_qdrant
+from utils.benchmark_corpus import corpus_doc_pages
+import config
+
+# runs the ingestion pipeline on a fixed corpus against a scratch collection and reports
+# the throughput of every stage. the embedding cache and the checkpoint are never used,
+# so every run does the same amount of work
+
+BENCHMARK_COLLECTION_NAME = "materials_benchmark"
+
+parser = argparse.ArgumentParser(
+    description="Benchmark the ingestion pipeline on a synthetic corpus or a summary doc snapshot")
+parser.add_argument("--docs", type=int, default=2000,
+                    help="number of docs to ingest (default: 2000)")
+parser.add_argument("--snapshot", metavar="PATH",
+                    help="take the docs from a summary doc snapshot instead of generating them")
+parser.add_argument("--page-size", type=int, default=500)
+parser.add_argument("--batch-size", type=int, default=1600)
+parser.add_argument("--format-workers", type=int, default=None,
+                    help="format docs in a process pool with this many workers (default: in the pipeline thread)")
+parser.add_argument("--upload-workers", type=int, default=4)
+parser.add_argument("--embedding-workers", type=int, default=0,
+                    help="embed in this many worker processes (default: in the pipeline thread)")
+args = parser.parse_args()
+
+
+if not config.USE_LOCAL_QDRANT and not is_embedded_qdrant():
+    print("Ensure the system is configured to use a local Qdrant store before running the benchmark.")
+    exit(0)
+
+format_pool = start_format_pool(
+    args.format_workers) if args.format_workers else None
+embedding_pool = EmbeddingWorkerPool(
+    args.embedding_workers) if args.embedding_workers else None
+metrics = IngestionMetrics()
+tokenizer, model = get_matscibert()
+embedding_model = CustomEmbeddings(
+    tokenizer, model, metrics=metrics, worker_pool=embedding_pool)
+qdrant_client = get_qdrant_client()
+if qdrant_client.collection_exists(collection_name=BENCHMARK_COLLECTION_NAME):
+    qdrant_client.delete_collection(collection_name=BENCHMARK_COLLECTION_NAME)
+create_collection(qdrant_client, BENCHMARK_COLLECTION_NAME)
+
+embedded_batches = stream_embedded_batches(
+    corpus_doc_pages(args.docs, args.snapshot, args.page_size),
+    embedding_model,
+    SectionTokenSplitter(tokenizer),
+    batch_size=args.batch_size,
+    format_pool=format_pool,
+    metrics=metrics
+)
+ingest(
+    embedded_batches,
+    qdrant_client,
+    BENCHMARK_COLLECTION_NAME,
+    None,
+    upload_workers=1 if is_embedded_qdrant() else args.upload_workers,
+    metrics=metrics
+)
+if format_pool is not None:
+    format_pool.shutdown()
+if embedding_pool is not None:
+    embedding_pool.shutdown()
+qdrant_client.delete_collection(collection_name=BENCHMARK_COLLECTION_NAME)
+print(metrics.report())
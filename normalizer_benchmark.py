@@ -0,0 +1,58 @@
+import os
+import pathlib
+import random
+import timeit
+from tokenizers.normalizers import BertNormalizer
+from utils.text_normalizer import VOCAB_MAPPINGS_PATH, TextNormalizer
+
+# compares `TextNormalizer` with the previous per-call implementation of
+# `CustomEmbeddings.normalize_text_with_bert` and checks that both produce the same output
+
+
+def legacy_normalize_text_with_bert(text: str) -> str:
+    f = open(os.path.join(pathlib.Path(
+        __file__).parent.resolve(), 'utils', 'vocab_mappings.txt'), 'r')
+    mappings = f.read().strip().split('\n')
+    f.close()
+    mappings = {m[0]: m[2:] for m in mappings}
+    norm = BertNormalizer(lowercase=False, strip_accents=True,
+                          clean_text=True, handle_chinese_chars=True)
+    text = [norm.normalize_str(s) for s in text.split('\n')]
+    out = []
+    for s in text:
+        norm_s = ''
+        for c in s:
+            norm_s += mappings.get(c, ' ')
+        out.append(norm_s)
+    return '\n'.join(out)
+
+
+def sample_texts(count: int, seed: int = 0) -> list[str]:
+    """description-like texts mixing ascii, mapped symbols, accents and unmapped characters"""
+    rng = random.Random(seed)
+    with open(VOCAB_MAPPINGS_PATH, 'r') as f:
+        mapped_chars = [line[0] for line in f.read().strip().split('\n')]
+    alphabet = [*"abcdefghijklmnopqrstuvwxyz0123456789 .,;:=()-", *"éüÅ°μΩ漢\t"]
+    return [
+        "\n".join(
+            "".join(rng.choice(mapped_chars) if rng.random() < .1 else rng.choice(alphabet)
+                    for _ in range(rng.randint(200, 1500)))
+            for _ in range(rng.randint(1, 3))
+        )
+        for _ in range(count)
+    ]
+
+
+texts = sample_texts(500)
+normalizer = TextNormalizer()
+assert normalizer.normalize_batch(texts) == [legacy_normalize_text_with_bert(text) for text in texts], \
+    "TextNormalizer output differs from the legacy implementation"
+print(f"outputs identical for {len(texts)} texts")
+
+legacy_seconds = min(timeit.repeat(
+    lambda: [legacy_normalize_text_with_bert(text) for text in texts], number=1, repeat=3))
+batch_seconds = min(timeit.repeat(
+    lambda: normalizer.normalize_batch(texts), number=1, repeat=3))
+print(f"legacy:         {legacy_seconds * 1000:.1f} ms ({len(texts) / legacy_seconds:.0f} texts/s)")
+print(f"TextNormalizer: {batch_seconds * 1000:.1f} ms ({len(texts) / batch_seconds:.0f} texts/s)")
+print(f"speedup:        {legacy_seconds / batch_seconds:.1f}x")
@@ -0,0 +1,49 @@
+import argparse
+import time
+import numpy as np
+from utils.vector_projection import PCAProjection
+from utils.vector_snapshot import cosine_top_k, read_vector_snapshot
+
+# fits PCA projections of several sizes on a sample of a full-width vector snapshot
+# (`api_data_extractor.py --export-vectors DIR` without VECTOR_PROJECTION_DIM) and reports
+# the recall@k of a search over the projected vectors against the exact full-width search
+
+parser = argparse.ArgumentParser(
+    description="Compare the recall of projected vectors with the full-width vectors of a snapshot")
+parser.add_argument("vectors", metavar="DIR",
+                    help="full-width vector snapshot written by api_data_extractor.py --export-vectors")
+parser.add_argument("--dimensions", type=int, nargs="+", default=[64, 128, 256])
+parser.add_argument("--sample-size", type=int, default=4800,
+                    help="vectors the projections are fitted on (default: 4800)")
+parser.add_argument("--queries", type=int, default=200,
+                    help="number of stored vectors used as queries (default: 200)")
+parser.add_argument("-k", type=int, default=10)
+args = parser.parse_args()
+
+vectors, _, _ = read_vector_snapshot(args.vectors)
+rng = np.random.default_rng(0)
+sample = np.asarray(vectors[np.sort(rng.choice(
+    len(vectors), size=min(args.sample_size, len(vectors)), replace=False))])
+queries = np.asarray(vectors[rng.choice(
+    len(vectors), size=min(args.queries, len(vectors)), replace=False)])
+exact_top_k = cosine_top_k(vectors, queries, args.k)
+
+print(f"{'dimensions':<12}{'bytes/vector':>15}{'variance':>10}{f'recall@{args.k}':>12}{'search s':>10}")
+print(f"{vectors.shape[1]:<12}{vectors.shape[1] * 4:>15}{1:>10.3f}{1:>12.3f}{'-':>10}")
+for dimension in args.dimensions:
+    projection = PCAProjection.fit(sample, dimension)
+    # the projected snapshot is built block by block, like the extractor projects every batch
+    projected_vectors = np.concatenate([
+        projection.transform(np.asarray(vectors[start_idx:start_idx + 65536]))
+        for start_idx in range(0, len(vectors), 65536)
+    ])
+    start_time = time.perf_counter()
+    projected_top_k = cosine_top_k(
+        projected_vectors, projection.transform(queries), args.k)
+    search_seconds = time.perf_counter() - start_time
+    recall = np.mean([
+        len(set(exact_idxs) & set(projected_idxs)) / args.k
+        for exact_idxs, projected_idxs in zip(exact_top_k, projected_top_k)
+    ])
+    print(f"{dimension:<12}{dimension * 4:>15}{projection.explained_variance:>10.3f}"
+          f"{recall:>12.3f}{search_seconds:>10.2f}")
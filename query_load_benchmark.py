@@ -0,0 +1,67 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import random
+import time
+import numpy as np
+from utils.embeddings import CustomEmbeddings
+from utils.embedding_models import get_matscibert
+
+# simulates concurrent chat sessions embedding distinct queries, with and without micro-batching,
+# and reports the query throughput and latency percentiles of both
+
+parser = argparse.ArgumentParser(
+    description="Benchmark concurrent embed_query calls with and without micro-batching")
+parser.add_argument("--sessions", type=int, default=16,
+                    help="number of concurrent sessions (default: 16)")
+parser.add_argument("--queries", type=int, default=20,
+                    help="queries per session (default: 20)")
+parser.add_argument("--batch-size", type=int, default=16)
+parser.add_argument("--max-wait-ms", type=float, default=5)
+args = parser.parse_args()
+
+QUERY_TEMPLATES = [
+    "What is the band gap of {}?",
+    "Which {} compounds are thermodynamically stable?",
+    "Find materials containing {} with a high bulk modulus",
+    "Is {} magnetic?",
+    "List metallic {} oxides with a low energy above hull",
+]
+ELEMENTS = ["Li", "Na", "Fe", "Co", "Ni", "Mn", "Ti", "Cu", "Zn", "Si"]
+
+
+def session_queries(session_idx: int) -> list[str]:
+    rng = random.Random(session_idx)
+    return [
+        f"{rng.choice(QUERY_TEMPLATES).format(rng.choice(ELEMENTS))} ({session_idx}-{query_idx})"
+        for query_idx in range(args.queries)
+    ]
+
+
+def run_session(embedding_model: CustomEmbeddings, queries: list[str]) -> list[float]:
+    latencies = []
+    for query in queries:
+        start_time = time.perf_counter()
+        embedding_model.embed_query(query)
+        latencies.append(time.perf_counter() - start_time)
+    return latencies
+
+
+tokenizer, model = get_matscibert()
+print(f"{'mode':<12}{'queries/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'batch':>8}")
+for mode, query_batch_size in (("serial", 0), ("batched", args.batch_size)):
+    embedding_model = CustomEmbeddings(
+        tokenizer, model, query_batch_size=query_batch_size, query_batch_wait=args.max_wait_ms / 1000)
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        latencies = np.concatenate(list(executor.map(
+            lambda session_idx: run_session(
+                embedding_model, session_queries(session_idx)),
+            range(args.sessions)
+        ))) * 1000
+    seconds = time.perf_counter() - start_time
+    batcher = embedding_model.query_batcher
+    mean_batch_size = batcher.requests / batcher.batches if batcher is not None and batcher.batches else 1.
+    print(f"{mode:<12}{len(latencies) / seconds:>12.1f}{np.percentile(latencies, 50):>10.1f}"
+          f"{np.percentile(latencies, 95):>10.1f}{np.percentile(latencies, 99):>10.1f}{mean_batch_size:>8.2f}")
+    if batcher is not None:
+        batcher.close()
@@ -0,0 +1,55 @@
+import argparse
+import json
+import subprocess
+import sys
+
+# measures the cold start of the chatbot: the import time and peak memory of every module on its
+# startup path, each in a fresh interpreter, and optionally the time to create the retrieval resources
+
+STARTUP_MODULES = [
+    "utils.data_formatting",
+    "streamlit_components.session_state",
+    "streamlit_components.sidebar",
+    "utils.state_graph",
+]
+
+MEASURE_IMPORT = """
+import importlib, json, resource, sys, time
+start_time = time.perf_counter()
+importlib.import_module(sys.argv[1])
+seconds = time.perf_counter() - start_time
+print(json.dumps({"seconds": seconds, "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+MEASURE_RETRIEVAL = """
+import json, resource, time
+from utils import state_graph
+start_time = time.perf_counter()
+state_graph.vectorstore.get()
+seconds = time.perf_counter() - start_time
+print(json.dumps({"seconds": seconds, "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+parser = argparse.ArgumentParser(
+    description="Measure the import time and memory of the chatbot startup path")
+parser.add_argument("--with-retrieval", action="store_true",
+                    help="also load the embedding model and connect to Qdrant")
+args = parser.parse_args()
+
+
+def measure(script: str, *script_args: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", script, *script_args],
+        check=True, capture_output=True, text=True
+    ).stdout
+    # the last line holds the measurement, anything before it is printed by the imported modules
+    return json.loads(output.strip().splitlines()[-1])
+
+
+print(f"{'step':<40}{'seconds':>10}{'max RSS MB':>12}")
+for module in STARTUP_MODULES:
+    result = measure(MEASURE_IMPORT, module)
+    print(f"{'import ' + module:<40}{result['seconds']:>10.2f}{result['max_rss_mb']:>12.1f}")
+if args.with_retrieval:
+    result = measure(MEASURE_RETRIEVAL)
+    print(f"{'create retrieval resources':<40}{result['seconds']:>10.2f}{result['max_rss_mb']:>12.1f}")
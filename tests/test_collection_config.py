@@ -0,0 +1,36 @@
+from qdrant_client import QdrantClient, models
+from utils.collection_config import stale_chunk_filter
+
+_ZERO_ID = "00000000-0000-0000-0000-{:012d}"
+
+
+def _point(idx: int, material_id: str, chunk_idx=None) -> models.PointStruct:
+    payload = {"material_id": material_id}
+    if chunk_idx is not None:
+        payload["chunk_idx"] = chunk_idx
+    return models.PointStruct(id=_ZERO_ID.format(idx), vector=[1., 0.], payload=payload)
+
+
+def test_stale_chunk_filter_keeps_chunks_of_other_batches():
+    client = QdrantClient(":memory:")
+    client.create_collection("materials", vectors_config=models.VectorParams(
+        size=2, distance=models.Distance.COSINE))
+    client.upsert("materials", points=[
+        # previous ingestion: mp-1 had 4 chunks, one stored without a chunk index
+        _point(1, "mp-1"), _point(2, "mp-1", 1), _point(3, "mp-1", 2), _point(4, "mp-1", 3),
+        _point(5, "mp-2", 0), _point(6, "mp-3", 0), _point(7, "mp-3", 1),
+        # current ingestion: mp-1 has 3 chunks, the last one is uploaded in another batch,
+        # mp-3 has a single chunk
+        _point(10, "mp-1", 0), _point(11, "mp-1", 1), _point(12, "mp-1", 2), _point(13, "mp-3", 0),
+    ])
+    stale_filter = stale_chunk_filter([
+        (_ZERO_ID.format(10), "mp-1", 0, 3), (_ZERO_ID.format(11), "mp-1", 1, 3),
+        (_ZERO_ID.format(13), "mp-3", 0, 1)])
+    client.delete("materials", points_selector=models.FilterSelector(filter=stale_filter))
+    remaining = {point.id for point in client.scroll("materials", limit=100)[0]}
+    assert remaining == {_ZERO_ID.format(idx) for idx in (3, 4, 5, 10, 11, 12, 13)}
+
+    stale_filter = stale_chunk_filter([(_ZERO_ID.format(12), "mp-1", 2, 3)])
+    client.delete("materials", points_selector=models.FilterSelector(filter=stale_filter))
+    remaining = {point.id for point in client.scroll("materials", limit=100)[0]}
+    assert remaining == {_ZERO_ID.format(idx) for idx in (5, 10, 11, 12, 13)}
@@ -0,0 +1,52 @@
+import pytest
+from utils.material_properties import PropertyConstraint, extract_property_constraints
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("band gap between 1 and 2 eV", PropertyConstraint("band_gap", gte=1., lte=2.)),
+    ("band gap from 2 to 1 eV", PropertyConstraint("band_gap", gte=1., lte=2.)),
+    ("band gap of 1.5-3", PropertyConstraint("band_gap", gte=1.5, lte=3.)),
+    ("energy above hull between 10 and 50 meV", PropertyConstraint("energy_above_hull", gte=.01, lte=.05)),
+    ("energy above hull 0 meV to 0.1 eV", PropertyConstraint("energy_above_hull", gte=0., lte=.1)),
+    ("formation energy from -2 eV to 500 meV", PropertyConstraint("formation_energy_per_atom", gte=-2., lte=.5)),
+])
+def test_ranges(question, expected):
+    assert extract_property_constraints(question) == [expected]
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("band gap above 2 eV", PropertyConstraint("band_gap", gte=2.)),
+    ("band gap of at most 0.5", PropertyConstraint("band_gap", lte=.5)),
+    ("energy above hull below 50 meV", PropertyConstraint("energy_above_hull", lte=.05)),
+    ("bulk modulus >= 100 GPa", PropertyConstraint("bulk_modulus", gte=100.)),
+    ("shear moduli less than 20", PropertyConstraint("shear_modulus", lte=20.)),
+])
+def test_single_bounds(question, expected):
+    assert extract_property_constraints(question) == [expected]
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("stable materials", [PropertyConstraint("is_stable", value=True)]),
+    ("list only stable", [PropertyConstraint("is_stable", value=True)]),
+    ("compounds that are stable", [PropertyConstraint("is_stable", value=True)]),
+    ("unstable phases", [PropertyConstraint("is_stable", value=False)]),
+    ("stable non-metallic oxides", [PropertyConstraint("is_stable", value=True),
+                                    PropertyConstraint("is_metal", value=False)]),
+    ("semiconductors with a direct band gap", [PropertyConstraint("is_metal", value=False),
+                                               PropertyConstraint("is_gap_direct", value=True)]),
+    ("indirect gap materials", [PropertyConstraint("is_gap_direct", value=False)]),
+])
+def test_boolean_constraints(question, expected):
+    assert extract_property_constraints(question) == expected
+
+
+@pytest.mark.parametrize("question", [
+    "What makes a material stable?",
+    "How stable is LiFePO4?",
+    "How stable are the materials in this family?",
+    "Why is copper metallic?",
+    "What is a direct band gap?",
+    "What is the band gap of mp-149?",
+])
+def test_questions_without_constraints(question):
+    assert extract_property_constraints(question) == []
@@ -0,0 +1,35 @@
+from emmet.core.summary import SummaryDoc
+from pymatgen.core import Lattice, Structure
+from utils.data_formatting import format_summary_doc
+from utils.mp_snapshot import load_summary_snapshot, save_summary_snapshot
+
+
+def _summary_doc() -> SummaryDoc:
+    return SummaryDoc.model_construct(
+        material_id="mp-149",
+        theoretical=False,
+        structure=Structure(
+            Lattice.cubic(5.47), ["Si", "Si"], [[0, 0, 0], [.25, .25, .25]]),
+        formation_energy_per_atom=-0.011,
+        energy_above_hull=0.,
+        is_stable=True,
+        band_gap=0.611,
+        is_gap_direct=False,
+        is_metal=False,
+        bulk_modulus={"vrh": 88.3},
+    )
+
+
+def test_snapshot_round_trip_keeps_structure(tmp_path):
+    snapshot_path = str(tmp_path / "summary_docs.msgpack.gz")
+    doc = _summary_doc()
+
+    # the snapshot is written while the pages are consumed
+    saved_pages = list(save_summary_snapshot([[doc]], snapshot_path))
+    loaded_pages = list(load_summary_snapshot(snapshot_path))
+
+    assert saved_pages == [[doc]]
+    [[loaded_doc]] = loaded_pages
+    assert isinstance(loaded_doc.structure, Structure)
+    assert loaded_doc.structure == doc.structure
+    assert format_summary_doc(loaded_doc) == format_summary_doc(doc)
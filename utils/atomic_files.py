@@ -0,0 +1,26 @@
+from contextlib import contextmanager
+import os
+from typing import Generator
+import uuid
+
+
+@contextmanager
+def atomic_output_path(path: str, suffix: str = ".tmp") -> Generator[str, None, None]:
+    """
+    a temporary path next to `path` to write to, moved over `path` once the block completes and
+    removed when it fails. the name is unique to the call, so processes writing the same file at
+    once do not write to the same temporary file, and readers never see a partial `path`
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # unlike mkstemp, the file is created by the writer with the permissions of the umask
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}{suffix}"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+__all__ = ["atomic_output_path"]
@@ -0,0 +1,79 @@
+import random
+from typing import Generator, Iterable, Optional
+from emmet.core.summary import SummaryDoc
+from pymatgen.core import Lattice, Structure
+from utils.data_formatting import format_summary_doc
+from utils.mp_snapshot import load_summary_snapshot
+from utils.text_normalizer import get_text_normalizer
+
+# fixed corpora for benchmarks and reports that must not depend on the MP API
+
+SYNTHETIC_ELEMENTS = ["Li", "Na", "K", "Mg", "Ca", "Ti", "V", "Cr", "Mn", "Fe",
+                      "Co", "Ni", "Cu", "Zn", "Al", "Si", "P", "S", "O", "N"]
+
+
+def synthetic_summary_docs(doc_count: int, page_size: int, seed: int = 0) -> Generator[list[SummaryDoc], None, None]:
+    """deterministic pages of summary docs with random structures and properties"""
+    rng = random.Random(seed)
+    for page_start_idx in range(0, doc_count, page_size):
+        page = []
+        for doc_idx in range(page_start_idx, min(page_start_idx + page_size, doc_count)):
+            elements = rng.sample(SYNTHETIC_ELEMENTS, rng.randint(1, 4))
+            site_count = rng.randint(2, 48)
+            structure = Structure(
+                Lattice.from_parameters(
+                    *(rng.uniform(2.5, 12) for _ in range(3)),
+                    *(rng.uniform(60, 120) for _ in range(3))
+                ),
+                [rng.choice(elements) for _ in range(site_count)],
+                [[rng.random() for _ in range(3)] for _ in range(site_count)]
+            )
+            page.append(SummaryDoc.model_construct(
+                material_id=f"mp-{doc_idx + 1}",
+                theoretical=rng.random() < .5,
+                structure=structure,
+                uncorrected_energy_per_atom=rng.uniform(-10, 0),
+                energy_per_atom=rng.uniform(-10, 0),
+                formation_energy_per_atom=rng.uniform(-4, 1),
+                energy_above_hull=rng.uniform(0, .5),
+                is_stable=rng.random() < .3,
+                band_gap=rng.uniform(0, 6),
+                is_gap_direct=rng.random() < .5,
+                is_metal=rng.random() < .4,
+                total_magnetization=rng.uniform(0, 5),
+                num_magnetic_sites=rng.randint(0, site_count),
+                bulk_modulus={"vrh": round(rng.uniform(10, 300), 1)},
+                shear_modulus={"vrh": round(rng.uniform(5, 200), 1)},
+                universal_anisotropy=rng.uniform(0, 2),
+                possible_species=[f"{element}{rng.choice(['+', '-'])}" for element in elements],
+            ))
+        yield page
+
+
+def limit_doc_pages(doc_pages: Iterable[list], doc_count: int) -> Generator[list, None, None]:
+    for page in doc_pages:
+        if doc_count <= 0:
+            return
+        yield page[:doc_count]
+        doc_count -= len(page)
+
+
+def corpus_doc_pages(doc_count: int, snapshot_path: Optional[str] = None, page_size: int = 500) -> Generator[list, None, None]:
+    """the first `doc_count` docs of the summary doc snapshot at `snapshot_path`, or synthetic docs without one"""
+    if snapshot_path:
+        return limit_doc_pages(load_summary_snapshot(snapshot_path), doc_count)
+    return synthetic_summary_docs(doc_count, page_size)
+
+
+def corpus_descriptions(doc_count: int, snapshot_path: Optional[str] = None) -> list[str]:
+    """normalized descriptions of the corpus docs, as they are embedded at ingest"""
+    text_normalizer = get_text_normalizer()
+    return [
+        text_normalizer.normalize(format_summary_doc(doc)[1])
+        for page in corpus_doc_pages(doc_count, snapshot_path)
+        for doc in page
+    ]
+
+
+__all__ = ["synthetic_summary_docs", "limit_doc_pages",
+           "corpus_doc_pages", "corpus_descriptions"]
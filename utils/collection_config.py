@@ -0,0 +1,180 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable, NamedTuple, Optional, Tuple, Union
+from qdrant_client import QdrantClient, models
+from utils.material_properties import BOOLEAN_PROPERTIES, NUMERIC_PROPERTIES
+from utils.sparse_vectors import SPARSE_VECTOR_NAME
+import config
+
+QuantizationConfig = Union[models.ScalarQuantization,
+                           models.BinaryQuantization, None]
+
+# payload fields the retrieval filters on, indexed so filtered lookups do not scan every point
+PAYLOAD_INDEXES = {
+    "material_id": models.PayloadSchemaType.KEYWORD,
+    # ranges of chunk indexes are deleted when a material is ingested again
+    "chunk_idx": models.PayloadSchemaType.INTEGER,
+    **{key: models.PayloadSchemaType.FLOAT for key in NUMERIC_PROPERTIES},
+    **{key: models.PayloadSchemaType.BOOL for key in BOOLEAN_PROPERTIES},
+}
+
+
+class CollectionStorage(NamedTuple):
+    # "none", "scalar" (int8) or "binary"
+    quantization: str = "none"
+    # keep the quantized vectors in RAM when the original vectors are on disk
+    quantization_always_ram: bool = True
+    # original float32 vectors memory-mapped from disk instead of held in RAM
+    vectors_on_disk: bool = False
+    # payload read from disk when it is needed instead of held in RAM
+    payload_on_disk: bool = False
+    # searches over quantized vectors fetch oversampling * k candidates and rescore them with the original vectors
+    rescore: bool = True
+    oversampling: float = 2.
+
+    @staticmethod
+    def from_config() -> "CollectionStorage":
+        return CollectionStorage(
+            quantization=config.QDRANT_QUANTIZATION,
+            quantization_always_ram=config.QDRANT_QUANTIZATION_ALWAYS_RAM,
+            vectors_on_disk=config.QDRANT_VECTORS_ON_DISK,
+            payload_on_disk=config.QDRANT_PAYLOAD_ON_DISK,
+            rescore=config.QDRANT_RESCORE,
+            oversampling=config.QDRANT_OVERSAMPLING,
+        )
+
+    def quantization_config(self) -> QuantizationConfig:
+        if self.quantization == "scalar":
+            return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=.99, always_ram=self.quantization_always_ram))
+        if self.quantization == "binary":
+            return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(
+                always_ram=self.quantization_always_ram))
+        assert self.quantization == "none", f"unknown quantization {self.quantization}"
+        return None
+
+    def search_params(self) -> Optional[models.SearchParams]:
+        if self.quantization == "none":
+            return None
+        return models.SearchParams(quantization=models.QuantizationSearchParams(
+            rescore=self.rescore, oversampling=self.oversampling))
+
+    def estimated_ram_bytes(self, vector_count: int, vector_size: int) -> int:
+        """RAM for the vectors and their index, following Qdrant's rule of thumb of 1.5x the raw vector size"""
+        quantized_size = {"none": 0, "scalar": vector_size,
+                          "binary": vector_size / 8}[self.quantization]
+        original_size = 0 if self.vectors_on_disk else vector_size * 4
+        if quantized_size and not self.quantization_always_ram:
+            quantized_size = 0
+        return int(vector_count * (original_size + quantized_size) * 1.5)
+
+
+def create_collection(
+    qdrant_client: QdrantClient,
+    collection_name: str,
+    vector_size: int = 768,
+    storage: Optional[CollectionStorage] = None
+):
+    storage = storage or CollectionStorage.from_config()
+    qdrant_client.create_collection(
+        collection_name=collection_name,
+        vectors_config=models.VectorParams(
+            size=vector_size, distance=models.Distance.COSINE, on_disk=storage.vectors_on_disk),
+        # BM25 term weights for the lexical half of hybrid searches, Qdrant keeps the IDF up to date
+        sparse_vectors_config={SPARSE_VECTOR_NAME: models.SparseVectorParams(
+            index=models.SparseIndexParams(on_disk=storage.vectors_on_disk), modifier=models.Modifier.IDF)},
+        on_disk_payload=storage.payload_on_disk,
+        quantization_config=storage.quantization_config(),
+    )
+    create_payload_indexes(qdrant_client, collection_name)
+
+
+def create_payload_indexes(qdrant_client: QdrantClient, collection_name: str):
+    """creates the missing `PAYLOAD_INDEXES` of `collection_name`, existing points are indexed in the background"""
+    payload_schema = qdrant_client.get_collection(collection_name).payload_schema
+    for field_name, field_schema in PAYLOAD_INDEXES.items():
+        if field_name not in payload_schema:
+            qdrant_client.create_payload_index(
+                collection_name=collection_name, field_name=field_name, field_schema=field_schema)
+            print(f"{datetime.now()}: created {field_schema.value} index on {collection_name}.{field_name}")
+
+
+def stale_chunk_filter(chunks: Iterable[Tuple[str, str, int, int]]) -> models.Filter:
+    """
+    the points left over from previous ingestions of the materials of `chunks`, given as (point_id,
+    material_id, chunk_idx, chunk_count) tuples: points at the same chunk indexes with other IDs,
+    points past the last chunk of a material and points stored without a chunk index. the chunks
+    of a material uploaded in other batches are not matched
+    """
+    point_ids = defaultdict(list)
+    chunk_idxs = defaultdict(list)
+    chunk_counts = {}
+    for point_id, material_id, chunk_idx, chunk_count in chunks:
+        point_ids[material_id].append(point_id)
+        chunk_idxs[material_id].append(chunk_idx)
+        chunk_counts[material_id] = chunk_count
+    # every chunk of these materials is in `chunks`, any other point of theirs is stale
+    complete_material_ids = [material_id for material_id, idxs in chunk_idxs.items()
+                             if len(idxs) == chunk_counts[material_id]]
+    material_filters = [models.Filter(
+        must=[models.FieldCondition(key="material_id", match=models.MatchAny(any=complete_material_ids))],
+        must_not=[models.HasIdCondition(has_id=[
+            point_id for material_id in complete_material_ids for point_id in point_ids[material_id]])]
+    )] if complete_material_ids else []
+    # the materials split across batches, at most the first and the last one of a batch
+    for material_id, idxs in chunk_idxs.items():
+        if len(idxs) == chunk_counts[material_id]:
+            continue
+        stale_idxs = [models.FieldCondition(
+            key="chunk_idx", match=models.MatchAny(any=idxs))]
+        if chunk_counts[material_id] - 1 in idxs:
+            stale_idxs.append(models.FieldCondition(
+                key="chunk_idx", range=models.Range(gte=chunk_counts[material_id])))
+        if 0 in idxs:
+            stale_idxs.append(models.IsEmptyCondition(
+                is_empty=models.PayloadField(key="chunk_idx")))
+        material_filters.append(models.Filter(
+            must=[models.FieldCondition(key="material_id", match=models.MatchValue(value=material_id)),
+                  models.Filter(should=stale_idxs)],
+            must_not=[models.HasIdCondition(has_id=point_ids[material_id])]
+        ))
+    # the points of other materials are ruled out by a single condition before the material filters
+    return models.Filter(
+        must=[models.FieldCondition(key="material_id", match=models.MatchAny(any=list(chunk_idxs)))],
+        should=material_filters
+    )
+
+
+def has_sparse_vectors(qdrant_client: QdrantClient, collection_name: str) -> bool:
+    """whether `collection_name` was created with the sparse vectors of hybrid searches"""
+    sparse_vectors = qdrant_client.get_collection(
+        collection_name).config.params.sparse_vectors
+    return bool(sparse_vectors) and SPARSE_VECTOR_NAME in sparse_vectors
+
+
+def update_collection_storage(
+    qdrant_client: QdrantClient,
+    collection_name: str,
+    storage: Optional[CollectionStorage] = None
+):
+    """applies `storage` to an existing collection, Qdrant rebuilds the affected segments in the background"""
+    storage = storage or CollectionStorage.from_config()
+    params = qdrant_client.get_collection(collection_name).config
+    changes = {}
+    if bool(params.params.vectors.on_disk) != storage.vectors_on_disk:
+        changes["vectors_config"] = {
+            "": models.VectorParamsDiff(on_disk=storage.vectors_on_disk)}
+    if bool(params.params.on_disk_payload) != storage.payload_on_disk:
+        changes["collection_params"] = models.CollectionParamsDiff(
+            on_disk_payload=storage.payload_on_disk)
+    quantization_config = storage.quantization_config()
+    if params.quantization_config != quantization_config:
+        changes["quantization_config"] = quantization_config or models.Disabled.DISABLED
+    if changes:
+        qdrant_client.update_collection(
+            collection_name=collection_name, **changes)
+        print(f"{datetime.now()}: updated the storage of {collection_name}: {', '.join(changes)}")
+
+
+__all__ = ["PAYLOAD_INDEXES", "CollectionStorage", "create_collection",
+           "create_payload_indexes", "stale_chunk_filter", "has_sparse_vectors", "update_collection_storage"]
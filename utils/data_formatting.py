@@ -1,9 +1,14 @@
+from __future__ import annotations
 import re
-from emmet.core.summary import SummaryDoc, Structure
+from typing import TYPE_CHECKING
 from markdown import markdown
 import pandas as pd
 from bs4 import BeautifulSoup
 
+# emmet pulls in pymatgen and takes seconds to import, the chatbot only needs the markdown helpers
+if TYPE_CHECKING:
+    from emmet.core.summary import SummaryDoc, Structure
+
 
 def _format_structure(structure: Structure):
     lattice_params = structure.lattice.abc  # a, b, c
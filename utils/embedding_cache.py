@@ -0,0 +1,73 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import List, Optional
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed store of embeddings backed by SQLite.
+
+    Entries are keyed by (model name, sha256 of the chunk text) and stored as float32 blobs,
+    so unchanged chunks are never sent through the model twice, even across runs.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # the connection is shared by the pipeline threads, access is serialized with a lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text_hash BLOB NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text_hash)) WITHOUT ROWID"
+            )
+
+    @staticmethod
+    def _hash(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """cached embedding for each of `texts`, `None` where the text has not been embedded yet"""
+        hashes = [EmbeddingCache._hash(text) for text in texts]
+        found = {}
+        with self._lock:
+            # stay below SQLite's limit on the number of host parameters
+            for start_idx in range(0, len(hashes), 500):
+                hashes_slice = hashes[start_idx:start_idx + 500]
+                rows = self._connection.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? "
+                    f"AND text_hash IN ({', '.join('?' * len(hashes_slice))})",
+                    [model_name, *hashes_slice]
+                )
+                found.update(rows)
+        return [
+            np.frombuffer(found[text_hash], dtype=np.float32)
+            if text_hash in found else None
+            for text_hash in hashes
+        ]
+
+    def put_many(self, model_name: str, texts: List[str], embeddings: np.ndarray):
+        rows = [
+            (model_name, EmbeddingCache._hash(text),
+             np.asarray(embedding, dtype=np.float32).tobytes())
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)", rows)
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+__all__ = ["EmbeddingCache"]
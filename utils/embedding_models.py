@@ -1,14 +1,94 @@
+from typing import Callable, NamedTuple
+import torch
 from transformers import AutoTokenizer, AutoModel
+from utils.onnx_encoder import load_onnx_encoder
+import config
 
 
-def get_nomic_embed_text_v1():
+class InferenceProfile(NamedTuple):
+    # "torch" or "onnx"
+    backend: str = "torch"
+    # dynamically quantize the linear layers to int8, CPU only
+    quantize_int8: bool = False
+    # run the model in bfloat16, ignored when quantizing and by the ONNX backend
+    bf16: bool = False
+    # thread pools of torch or ONNX Runtime, 0 keeps their default
+    intra_op_threads: int = 0
+    inter_op_threads: int = 0
+
+    @staticmethod
+    def from_config() -> "InferenceProfile":
+        return InferenceProfile(
+            backend=config.EMBEDDING_BACKEND,
+            quantize_int8=config.EMBEDDING_QUANTIZE_INT8,
+            bf16=config.EMBEDDING_BF16,
+            intra_op_threads=config.TORCH_INTRA_OP_THREADS,
+            inter_op_threads=config.TORCH_INTER_OP_THREADS,
+        )
+
+
+def apply_inference_profile(model: torch.nn.Module, profile: InferenceProfile) -> torch.nn.Module:
+    """puts `model` in eval mode on its inference device, with the precision and thread settings of `profile`"""
+    if profile.intra_op_threads:
+        torch.set_num_threads(profile.intra_op_threads)
+    if profile.inter_op_threads and profile.inter_op_threads != torch.get_num_interop_threads():
+        try:
+            torch.set_num_interop_threads(profile.inter_op_threads)
+        except RuntimeError:
+            # the inter-op pool can only be sized before torch runs its first parallel work
+            print(f"the inter-op thread count is already fixed at {torch.get_num_interop_threads()}")
+    model.eval()
+    if profile.quantize_int8:
+        # quantized kernels only exist for the CPU
+        return torch.ao.quantization.quantize_dynamic(
+            model.to("cpu"), {torch.nn.Linear}, dtype=torch.qint8)
+    model = model.to(torch.device(
+        "cuda" if torch.cuda.is_available() else "cpu"))
+    if profile.bf16:
+        model = model.to(torch.bfloat16)
+    return model
+
+
+def model_precision(model) -> str:
+    # ONNX encoders know their precision
+    if hasattr(model, "precision"):
+        return model.precision
+    if any(isinstance(module, torch.ao.nn.quantized.dynamic.Linear) for module in model.modules()):
+        return "int8"
+    if next(model.parameters()).dtype == torch.bfloat16:
+        return "bf16"
+    return "fp32"
+
+
+def _load_model(model_name: str, load_model: Callable[[], torch.nn.Module], tokenizer, profile: InferenceProfile):
+    if profile.backend == "onnx":
+        return load_onnx_encoder(
+            model_name, load_model, tokenizer, config.EMBEDDING_ONNX_DIR,
+            quantize_int8=profile.quantize_int8,
+            intra_op_threads=profile.intra_op_threads,
+            inter_op_threads=profile.inter_op_threads
+        )
+    return apply_inference_profile(load_model(), profile)
+
+
+def get_nomic_embed_text_v1(profile: InferenceProfile = None):
     tokenizer = AutoTokenizer.from_pretrained('bert-base-uncased')
-    model = AutoModel.from_pretrained(
-        'nomic-ai/nomic-embed-text-v1', trust_remote_code=True)
+    model = _load_model(
+        'nomic-ai/nomic-embed-text-v1',
+        lambda: AutoModel.from_pretrained(
+            'nomic-ai/nomic-embed-text-v1', trust_remote_code=True),
+        tokenizer,
+        profile or InferenceProfile.from_config()
+    )
     return tokenizer, model
 
 
-def get_matscibert():
+def get_matscibert(profile: InferenceProfile = None):
     tokenizer = AutoTokenizer.from_pretrained("m3rg-iitd/matscibert")
-    model = AutoModel.from_pretrained("m3rg-iitd/matscibert")
+    model = _load_model(
+        "m3rg-iitd/matscibert",
+        lambda: AutoModel.from_pretrained("m3rg-iitd/matscibert"),
+        tokenizer,
+        profile or InferenceProfile.from_config()
+    )
     return tokenizer, model
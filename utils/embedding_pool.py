@@ -0,0 +1,131 @@
+from collections import deque
+from datetime import datetime
+import math
+import os
+from typing import Callable, Generator, List, Optional, Tuple
+import numpy as np
+from utils.embeddings import BATCH_SIZE, CustomEmbeddings
+from utils.embedding_models import InferenceProfile, get_matscibert
+from utils.ingestion_metrics import IngestionMetrics
+from utils.process_pool import start_process_pool
+import config
+
+# the embedding model of each worker process, loaded by the pool initializer
+_worker_embedding_model: CustomEmbeddings = None
+_worker_metrics: IngestionMetrics = None
+# stages timed inside the workers and reported back to the parent process
+_WORKER_STAGES = ("tokenize", "model forward")
+
+
+def _init_worker(load_model: Callable, profile: InferenceProfile, dynamic_padding: bool):
+    global _worker_embedding_model, _worker_metrics
+    _worker_metrics = IngestionMetrics()
+    _worker_embedding_model = CustomEmbeddings(
+        *load_model(profile), metrics=_worker_metrics, dynamic_padding=dynamic_padding)
+
+
+def _stage_totals() -> List[Tuple[str, float, int, int]]:
+    return [
+        (stage, _worker_metrics[stage].seconds,
+         _worker_metrics[stage].chunks, _worker_metrics[stage].tokens)
+        for stage in _WORKER_STAGES
+    ]
+
+
+def _embed_shard(texts: List[str]) -> Tuple[np.ndarray, List[Tuple[str, float, int, int]]]:
+    """embeddings of `texts` and the (stage, seconds, chunks, tokens) the worker spent on them"""
+    before = _stage_totals()
+    embeddings = _worker_embedding_model.embed_documents_array(texts)
+    stage_deltas = [
+        (stage, seconds - seconds_before, chunks -
+         chunks_before, tokens - tokens_before)
+        for (stage, seconds, chunks, tokens), (_, seconds_before, chunks_before, tokens_before)
+        in zip(_stage_totals(), before)
+    ]
+    return embeddings, stage_deltas
+
+
+class EmbeddingWorkerPool:
+    """
+    Embeds texts in `workers` forked processes, each with its own copy of the model and a fixed
+    torch thread budget, so bulk embedding scales past what a single torch process gets out of a
+    many-core CPU.
+
+    The pool has to be started before the calling process loads a model or runs torch in
+    parallel, a forked torch thread pool is not usable in the child.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        load_model: Callable = get_matscibert,
+        threads_per_worker: Optional[int] = None,
+        profile: Optional[InferenceProfile] = None,
+        dynamic_padding: bool = config.EMBEDDING_DYNAMIC_PADDING
+    ):
+        self._workers = workers
+        threads_per_worker = threads_per_worker or max(
+            1, (os.cpu_count() or 1) // workers)
+        # every worker gets its share of the cores, the inter-op pool is not used by the model
+        profile = (profile or InferenceProfile.from_config())._replace(
+            intra_op_threads=threads_per_worker, inter_op_threads=1)
+        # starts every worker and waits until its model is loaded
+        self._pool = start_process_pool(
+            workers, initializer=_init_worker, initargs=(load_model, profile, dynamic_padding))
+        print(f"{datetime.now()}: started {workers} embedding workers with {threads_per_worker} threads each")
+
+    def _shards(self, texts: List[str]) -> List[List[str]]:
+        # one shard per worker, in multiples of the model batch size
+        shard_size = max(BATCH_SIZE, math.ceil(
+            len(texts) / self._workers / BATCH_SIZE) * BATCH_SIZE)
+        return [texts[start_idx:start_idx + shard_size] for start_idx in range(0, len(texts), shard_size)]
+
+    def stream_embeddings(
+        self,
+        texts: List[str],
+        batch_size: int,
+        metrics: Optional[IngestionMetrics] = None,
+        max_pending_batches: int = 2
+    ) -> Generator[Tuple[int, int, np.ndarray], None, None]:
+        """
+        same contract as `CustomEmbeddings.stream_embedding_arrays`: (start_idx, end_idx, embeddings)
+        for every `batch_size` texts, in order. each batch is split across the workers, and up to
+        `max_pending_batches` batches are in flight so the workers do not drain between batches
+        """
+        pending_batches = deque()
+
+        def collect():
+            start_idx, shard_futures = pending_batches.popleft()
+            shard_embeddings = []
+            for future in shard_futures:
+                embeddings, stage_deltas = future.result()
+                shard_embeddings.append(embeddings)
+                if metrics is not None:
+                    for stage, seconds, chunks, tokens in stage_deltas:
+                        metrics.record(stage, seconds,
+                                       chunks=chunks, tokens=tokens)
+            embeddings = np.concatenate(shard_embeddings) if len(
+                shard_embeddings) > 1 else shard_embeddings[0]
+            return start_idx, start_idx + len(embeddings), embeddings
+
+        for start_idx in range(0, len(texts), batch_size):
+            pending_batches.append((start_idx, [
+                self._pool.submit(_embed_shard, shard)
+                for shard in self._shards(texts[start_idx:start_idx + batch_size])
+            ]))
+            while len(pending_batches) > max_pending_batches:
+                yield collect()
+        while pending_batches:
+            yield collect()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+__all__ = ["EmbeddingWorkerPool"]
@@ -1,14 +1,26 @@
-from typing import Generator, List, Tuple
+from typing import TYPE_CHECKING, Generator, List, Optional, Tuple
 from langchain_core.embeddings import Embeddings
 from torch.utils.data import DataLoader, Dataset
 from transformers import AutoTokenizer, AutoModel
-import os
-import pathlib
-from tokenizers.normalizers import BertNormalizer
 from datetime import datetime
+import time
+import numpy as np
 import torch
+from utils.embedding_cache import EmbeddingCache
+from utils.embedding_models import model_precision
+from utils.ingestion_metrics import IngestionMetrics
+from utils.lru_cache import LRUCache
+from utils.micro_batcher import MicroBatcher
+from utils.text_normalizer import get_text_normalizer
+from utils.vector_projection import PCAProjection
+import config
+
+if TYPE_CHECKING:
+    from utils.embedding_pool import EmbeddingWorkerPool
 
 BATCH_SIZE = 16
+# model window in tokens, including the special tokens, longer texts are truncated
+MAX_LENGTH = 512
 
 
 class ChunkDataset(Dataset):
@@ -22,71 +34,243 @@ class ChunkDataset(Dataset):
         return self.chunks[idx]
 
 
+def masked_mean_pooling(last_hidden_state: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+    """mean over the tokens covered by the attention mask, padding does not shift the embedding"""
+    mask = attention_mask.unsqueeze(-1).to(last_hidden_state.dtype)
+    return (last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+
+
 class CustomEmbeddings(Embeddings):
-    def __init__(self, tokenizer, model):
+    def __init__(
+        self,
+        tokenizer,
+        model,
+        cache: Optional[EmbeddingCache] = None,
+        metrics: Optional[IngestionMetrics] = None,
+        dynamic_padding: bool = config.EMBEDDING_DYNAMIC_PADDING,
+        query_cache: Optional[LRUCache] = None,
+        worker_pool: Optional["EmbeddingWorkerPool"] = None,
+        query_batch_size: int = 0,
+        query_batch_wait: float = .005,
+        projection: Optional[PCAProjection] = None
+    ):
         self._tokenizer = tokenizer
         self._model = model
+        # records the "tokenize" and "model forward" stages, when given
+        self._metrics = metrics
+        # embeddings are only computed for texts missing from the cache, when one is given
+        self._cache = cache
+        # query embeddings keyed by the normalized query, when given
+        self._query_cache = query_cache
+        # texts are embedded by the worker processes of the pool instead of `model`, when given.
+        # the workers have to load the same model with the same inference profile
+        self._worker_pool = worker_pool
+        # concurrent `embed_query` calls are embedded together in micro-batches of up to `query_batch_size`
+        # queries, waiting at most `query_batch_wait` seconds for a batch to fill up
+        self._query_batcher = MicroBatcher(
+            self.embed_documents_array, query_batch_size, query_batch_wait) if query_batch_size > 1 else None
+        # sort texts by token length, pad every batch to its longest text and pool over the attention mask,
+        # instead of padding everything to 512 tokens and averaging over every position
+        self._dynamic_padding = dynamic_padding
+        model_name = getattr(
+            model, "name_or_path", None) or type(model).__name__
+        # identifies the model output, the persistent cache always holds full-width model embeddings
+        self._model_embedding_id = f"{model_name}:masked-mean" if dynamic_padding else model_name
+        # int8 and bf16 models produce slightly different embeddings than the fp32 model
+        precision = model_precision(model)
+        if precision != "fp32":
+            self._model_embedding_id = f"{self._model_embedding_id}:{precision}"
+        self._dimension = model.config.hidden_size
+        # every returned embedding is projected to `projection.dimension`, when given
+        self._projection = projection
+        # the inputs are moved to wherever `get_matscibert` placed the model
+        self._device = model.device
+
+    @property
+    def embedding_id(self) -> str:
+        """identifies the model, the pooling and the projection, embeddings with different ids are not comparable"""
+        if self._projection is None:
+            return self._model_embedding_id
+        return f"{self._model_embedding_id}:pca{self._projection.dimension}-{self._projection.fingerprint}"
+
+    @property
+    def dimension(self) -> int:
+        return self._projection.dimension if self._projection is not None else self._dimension
+
+    @property
+    def projection(self) -> Optional[PCAProjection]:
+        return self._projection
+
+    def set_projection(self, projection: Optional[PCAProjection]):
+        """projects every embedding returned from now on, e.g. once a projection is fitted on this model's embeddings"""
+        self._projection = projection
+
+    @property
+    def query_cache(self) -> Optional[LRUCache]:
+        return self._query_cache
+
+    @property
+    def query_batcher(self) -> Optional[MicroBatcher]:
+        return self._query_batcher
 
     @staticmethod
-    def __process_batch(batch_of_texts, model, tokenizer, print_device):
+    def __process_batch(batch_of_texts, model, tokenizer, device, print_device, metrics=None) -> np.ndarray:
+        start_time = time.perf_counter()
         inputs = tokenizer(
             batch_of_texts,
             return_tensors="pt",
-            max_length=512,
+            max_length=MAX_LENGTH,
             truncation=True,
             padding="max_length"
         )
-        # use GPU if available
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        tokenized_time = time.perf_counter()
         if print_device:
             print(f'the device is {device}')
         inputs = {key: value.to(device) for key, value in inputs.items()}
-        with torch.no_grad():
+        with torch.inference_mode():
             embeddings = model(**inputs)[0].mean(dim=1)
-        return embeddings.cpu().tolist()
+        embeddings = embeddings.float().cpu().numpy()
+        if metrics is not None:
+            token_count = int(inputs["attention_mask"].sum())
+            metrics.record("tokenize", tokenized_time - start_time,
+                           chunks=len(batch_of_texts), tokens=token_count)
+            metrics.record("model forward", time.perf_counter() - tokenized_time,
+                           chunks=len(batch_of_texts), tokens=token_count)
+        return embeddings
+
+    def __process_sorted_batches(self, texts: List[str], out: np.ndarray, print_device: bool):
+        """embeds `texts` in batches of similar token length, writing each embedding to its row of `out`"""
+        start_time = time.perf_counter()
+        encoded = self._tokenizer(
+            texts, max_length=MAX_LENGTH, truncation=True)
+        token_counts = [len(input_ids) for input_ids in encoded["input_ids"]]
+        if self._metrics is not None:
+            self._metrics.record("tokenize", time.perf_counter() - start_time,
+                                 chunks=len(texts), tokens=sum(token_counts))
+        if print_device:
+            print(f'the device is {self._device}')
+        sorted_idxs = sorted(range(len(texts)), key=token_counts.__getitem__)
+        for batch_start_idx in range(0, len(sorted_idxs), BATCH_SIZE):
+            batch_idxs = sorted_idxs[batch_start_idx:batch_start_idx + BATCH_SIZE]
+            forward_start_time = time.perf_counter()
+            inputs = self._tokenizer.pad(
+                {key: [encoded[key][idx] for idx in batch_idxs]
+                    for key in encoded.keys()},
+                return_tensors="pt"
+            )
+            inputs = {key: value.to(self._device) for key, value in inputs.items()}
+            with torch.inference_mode():
+                batch_embeddings = masked_mean_pooling(
+                    self._model(**inputs)[0], inputs["attention_mask"])
+            out[batch_idxs] = batch_embeddings.float().cpu().numpy()
+            if self._metrics is not None:
+                self._metrics.record("model forward", time.perf_counter() - forward_start_time,
+                                     chunks=len(batch_idxs), tokens=sum(token_counts[idx] for idx in batch_idxs))
 
     @staticmethod
     def normalize_text_with_bert(text: str) -> str:
-        f = open(os.path.join(pathlib.Path(
-            __file__).parent.resolve(), 'vocab_mappings.txt'), 'r')
-        mappings = f.read().strip().split('\n')
-        f.close()
-        mappings = {m[0]: m[2:] for m in mappings}
-        norm = BertNormalizer(lowercase=False, strip_accents=True,
-                              clean_text=True, handle_chinese_chars=True)
-        text = [norm.normalize_str(s) for s in text.split('\n')]
-        out = []
-        for s in text:
-            norm_s = ''
-            for c in s:
-                norm_s += mappings.get(c, ' ')
-            out.append(norm_s)
-        return '\n'.join(out)
-
-    def stream_embeddings_in_batch(self, texts: List[str], batch_size=1600) -> Generator[Tuple[int, int, List[float]], None, None]:
-        assert batch_size % BATCH_SIZE == 0, f"batch_size should be a multiple of {BATCH_SIZE}"
+        return get_text_normalizer().normalize(text)
+
+    def __stream_model_embeddings(self, texts: List[str], batch_size: int) -> Generator[Tuple[int, int, np.ndarray], None, None]:
+        if self._worker_pool is not None:
+            yield from self._worker_pool.stream_embeddings(texts, batch_size, self._metrics)
+            return
+        if self._dynamic_padding:
+            # texts are only sorted within each yielded batch, so the stream stays incremental
+            for start_idx in range(0, len(texts), batch_size):
+                batch_texts = texts[start_idx:start_idx + batch_size]
+                embeddings = np.empty(
+                    (len(batch_texts), self._dimension), dtype=np.float32)
+                self.__process_sorted_batches(
+                    batch_texts, embeddings, print_device=start_idx == 0)
+                print(f'{datetime.now()}: generated {len(embeddings)} embeddings')
+                yield start_idx, start_idx + len(embeddings), embeddings
+            return
         dataset = ChunkDataset(texts)
         dataloader = DataLoader(dataset, batch_size=BATCH_SIZE, shuffle=False)
-        acc_embeddings = []
+        # every yielded batch gets its own buffer, consumers may hold on to it while the next one is filled
+        acc_embeddings = np.empty(
+            (min(batch_size, len(texts)), self._dimension), dtype=np.float32)
+        acc_count = 0
         start_idx = 0
         print_device = True
         for batch in dataloader:
             embeddings = CustomEmbeddings.__process_batch(
-                [*batch], self._model, self._tokenizer, print_device
+                [*batch], self._model, self._tokenizer, self._device, print_device, self._metrics
             )
             print_device = False
-            acc_embeddings.extend(embeddings)
-            while len(acc_embeddings) >= batch_size:
+            # batch_size is a multiple of BATCH_SIZE, so a batch never straddles two buffers
+            acc_embeddings[acc_count:acc_count + len(embeddings)] = embeddings
+            acc_count += len(embeddings)
+            if acc_count == batch_size:
                 end_idx = start_idx + batch_size   # exclusive
                 print(f'{datetime.now()}: generated {batch_size} embeddings')
-                yield start_idx, end_idx, acc_embeddings[:batch_size]
-                acc_embeddings = acc_embeddings[batch_size:]
+                yield start_idx, end_idx, acc_embeddings
                 start_idx = end_idx
-        if acc_embeddings:
-            yield start_idx, start_idx + len(acc_embeddings), acc_embeddings
+                acc_embeddings = np.empty(
+                    (min(batch_size, len(texts) - start_idx), self._dimension), dtype=np.float32)
+                acc_count = 0
+        if acc_count:
+            yield start_idx, start_idx + acc_count, acc_embeddings[:acc_count]
+
+    def __stream_cached_embeddings(self, texts: List[str], batch_size: int) -> Generator[Tuple[int, int, np.ndarray], None, None]:
+        if self._cache is None:
+            yield from self.__stream_model_embeddings(texts, batch_size)
+            return
+        for start_idx in range(0, len(texts), batch_size):
+            batch_texts = texts[start_idx:start_idx + batch_size]
+            cached_embeddings = self._cache.get_many(
+                self._model_embedding_id, batch_texts)
+            embeddings = np.empty(
+                (len(batch_texts), self._dimension), dtype=np.float32)
+            missing_idxs = []
+            for idx, embedding in enumerate(cached_embeddings):
+                if embedding is None:
+                    missing_idxs.append(idx)
+                else:
+                    embeddings[idx] = embedding
+            if missing_idxs:
+                missing_texts = [batch_texts[idx] for idx in missing_idxs]
+                computed_embeddings = np.concatenate([
+                    batch[2] for batch in self.__stream_model_embeddings(missing_texts, batch_size)
+                ])
+                self._cache.put_many(
+                    self._model_embedding_id, missing_texts, computed_embeddings)
+                embeddings[missing_idxs] = computed_embeddings
+            print(f'{datetime.now()}: {len(batch_texts) - len(missing_idxs)} of {len(batch_texts)} embeddings found in cache')
+            yield start_idx, start_idx + len(batch_texts), embeddings
+
+    def stream_embedding_arrays(self, texts: List[str], batch_size=1600) -> Generator[Tuple[int, int, np.ndarray], None, None]:
+        """same as `stream_embeddings_in_batch`, but every batch is a contiguous float32 array of shape (n, dimension)"""
+        assert batch_size % BATCH_SIZE == 0, f"batch_size should be a multiple of {BATCH_SIZE}"
+        for start_idx, end_idx, embeddings in self.__stream_cached_embeddings(texts, batch_size):
+            if self._projection is not None:
+                embeddings = self._projection.transform(embeddings)
+            yield start_idx, end_idx, embeddings
+
+    def stream_embeddings_in_batch(self, texts: List[str], batch_size=1600) -> Generator[Tuple[int, int, List[List[float]]], None, None]:
+        for start_idx, end_idx, embeddings in self.stream_embedding_arrays(texts, batch_size):
+            yield start_idx, end_idx, embeddings.tolist()
+
+    def embed_documents_array(self, texts: List[str]) -> np.ndarray:
+        batches = [embeddings for _, _, embeddings in self.stream_embedding_arrays(texts)]
+        if len(batches) == 1:
+            return batches[0]
+        return np.concatenate(batches) if batches else np.empty((0, self.dimension), dtype=np.float32)
 
+    # lists of floats are only built here, the LangChain `Embeddings` interface requires them
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        return [embedding for batch in self.stream_embeddings_in_batch(texts) for embedding in batch[2]]
+        return self.embed_documents_array(texts).tolist()
 
     def embed_query(self, text: str) -> List[float]:
-        return self.embed_documents([text])[0]
+        # queries are normalized the same way as the ingested documents
+        text = CustomEmbeddings.normalize_text_with_bert(text)
+        embedding = self._query_cache.get(
+            text) if self._query_cache is not None else None
+        if embedding is None:
+            embedding = self._query_batcher.embed(
+                text) if self._query_batcher is not None else self.embed_documents_array([text])[0]
+            if self._query_cache is not None:
+                self._query_cache.put(text, embedding)
+        # every caller gets its own list, the cached array is never handed out
+        return embedding.tolist()
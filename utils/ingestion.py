@@ -0,0 +1,520 @@
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+import hashlib
+import itertools
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Generator, Iterable, List, Optional, Tuple, TypeVar, Union
+from qdrant_client import QdrantClient, models
+from qdrant_client.models import Batch
+import numpy as np
+from emmet.core.summary import SummaryDoc
+from utils.collection_config import stale_chunk_filter
+from utils.data_formatting import format_summary_doc
+from utils.embeddings import CustomEmbeddings
+from utils.ingestion_metrics import IngestionMetrics
+from utils.material_properties import summary_doc_properties
+from utils.process_pool import start_process_pool
+from utils.sparse_vectors import SPARSE_VECTOR_NAME, bm25_document_vector
+from utils.vector_projection import PCAProjection
+
+# fixed namespace so that the same chunk always maps to the same point id across runs
+POINT_ID_NAMESPACE = uuid.UUID("5b0f7a8e-3c1d-4f6b-9a2e-6d4c8b1e7f30")
+# bumped when the fields stored with every point change, batches committed with older payloads are uploaded again
+# 2: typed material properties
+# 3: chunk index
+# 4: outdated chunks of the uploaded materials deleted
+PAYLOAD_VERSION = 4
+
+
+def chunk_content_hash(description_chunk: str) -> str:
+    return hashlib.sha256(description_chunk.encode("utf-8")).hexdigest()
+
+
+def make_point_id(material_id: str, chunk_idx: int, description_chunk: str) -> str:
+    """deterministic Qdrant point id derived from (material_id, chunk index, content hash)"""
+    key = f"{material_id}:{chunk_idx}:{chunk_content_hash(description_chunk)}"
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, key))
+
+
+def batch_key(point_ids: Iterable[str], embedding_id: str = "", payload_version: int = PAYLOAD_VERSION) -> str:
+    """
+    identifies a batch by the point ids it contains and the embeddings and payload stored for them,
+    so a changed chunk, a different embedding model or a new payload layout invalidates its batch
+    """
+    digest = hashlib.sha1(
+        f"{embedding_id}:payload-v{payload_version}".encode("utf-8"))
+    for point_id in point_ids:
+        digest.update(point_id.encode("ascii"))
+    return digest.hexdigest()
+
+
+class IngestionCheckpoint:
+    """
+    Append-only record of batches that have been committed to Qdrant.
+
+    Each line of the checkpoint file is a `batch_key`. A line is written (and fsynced) only
+    after the corresponding upsert has been acknowledged, so a restarted run can safely skip
+    every batch listed here.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        # batches are committed from the upload worker threads
+        self._lock = threading.Lock()
+        self._committed: set[str] = set()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self._committed = {line.strip() for line in f if line.strip()}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a")
+
+    def __len__(self):
+        return len(self._committed)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._committed
+
+    def mark_committed(self, key: str):
+        with self._lock:
+            if key in self._committed:
+                return
+            self._file.write(f"{key}\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._committed.add(key)
+
+    def reset(self):
+        self._file.close()
+        self._committed.clear()
+        self._file = open(self._path, "w")
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# region streaming pipeline
+T = TypeVar("T")
+# (point_id, material_id, chunk index within the material, chunks of the material, description_chunk, material properties)
+Chunk = Tuple[str, str, int, int, str, dict]
+# (material_id, description, material properties)
+Description = Tuple[str, str, dict]
+
+# fields dropped from the summary docs, see https://github.com/materialsproject/api/issues/922
+EXCLUDED_SUMMARY_FIELDS = {"builder_meta", "last_updated", "origins"}
+
+_STAGE_DONE = object()
+
+
+class _StageError:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def run_in_background(iterable: Iterable[T], maxsize: int = 2, name: str = None) -> Generator[T, None, None]:
+    """
+    Consume `iterable` in a daemon thread and hand its items over through a bounded queue.
+
+    Chaining stages through this lets them overlap while the queue size caps how many items
+    are held in memory between two stages. Exceptions raised by the stage are re-raised in the
+    consumer, and closing the consumer stops the producer thread.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_STAGE_DONE)
+        except BaseException as e:
+            put(_StageError(e))
+
+    threading.Thread(target=produce, name=name, daemon=True).start()
+    try:
+        while True:
+            item = items.get()
+            if item is _STAGE_DONE:
+                return
+            if isinstance(item, _StageError):
+                raise item.exc
+            yield item
+    finally:
+        stopped.set()
+
+
+def download_summary_docs(mpr, page_size: int = 1000) -> Generator[list, None, None]:
+    """
+    yields pages of summary docs, ordered by material id so that batches line up across runs.
+    only the material ids are listed up front, the full docs are fetched one page at a time
+    """
+    fields = set(mpr.materials.summary.available_fields) - \
+        EXCLUDED_SUMMARY_FIELDS
+    material_ids = sorted(
+        str(doc.material_id)
+        for doc in mpr.materials.summary.search(all_fields=False, fields=["material_id"])
+    )
+    print(f"{datetime.now()}: found {len(material_ids)} materials")
+    for page_start_idx in range(0, len(material_ids), page_size):
+        page = mpr.materials.summary.search(
+            material_ids=material_ids[page_start_idx:page_start_idx + page_size],
+            all_fields=False,
+            fields=[*fields]
+        )
+        yield sorted(page, key=lambda doc: str(doc.material_id))
+
+
+def describe_doc(doc: SummaryDoc) -> Tuple[str, str, dict, float, float]:
+    """
+    formats and normalizes `doc` and reads its typed properties. the seconds spent formatting and
+    normalizing are returned along with the description, since this may run in a worker process
+    """
+    start_time = time.perf_counter()
+    material_id, material_description = format_summary_doc(doc)
+    formatted_time = time.perf_counter()
+    material_description = CustomEmbeddings.normalize_text_with_bert(
+        material_description)
+    normalized_time = time.perf_counter()
+    return (str(material_id), material_description, summary_doc_properties(doc),
+            formatted_time - start_time, normalized_time - formatted_time)
+
+
+def _record_description(description: Tuple[str, str, dict, float, float], metrics: IngestionMetrics) -> Description:
+    material_id, material_description, properties, format_seconds, normalize_seconds = description
+    metrics.record("format", format_seconds, docs=1)
+    metrics.record("normalize", normalize_seconds, docs=1)
+    return material_id, material_description, properties
+
+
+def describe_docs(doc_pages: Iterable[list], metrics: IngestionMetrics) -> Generator[Description, None, None]:
+    for page in doc_pages:
+        for doc in page:
+            yield _record_description(describe_doc(doc), metrics)
+
+
+def start_format_pool(workers: int = None) -> ProcessPoolExecutor:
+    """
+    process pool for `describe_docs_in_pool`. workers are forked (where available) and started
+    right away from the calling thread, before the pipeline threads exist
+    """
+    return start_process_pool(workers or os.cpu_count())
+
+
+def describe_docs_in_pool(
+    doc_pages: Iterable[list],
+    pool: Executor,
+    metrics: IngestionMetrics,
+    chunksize: int = 16,
+    max_pending_pages: int = 2
+) -> Generator[Description, None, None]:
+    """
+    same as `describe_docs`, but formats and normalizes every page in `pool`, `chunksize` docs per task.
+    up to `max_pending_pages` pages are in flight so the workers do not drain between pages,
+    and the results are yielded in the original order
+    """
+    pending_pages = deque()
+    for page in doc_pages:
+        # the docs returned by MPRester are instances of a dynamically created model,
+        # which cannot be pickled, so they are sent to the workers as plain SummaryDocs
+        page = [SummaryDoc.model_construct(**dict(doc)) for doc in page]
+        pending_pages.append(pool.map(describe_doc, page, chunksize=chunksize))
+        while len(pending_pages) > max_pending_pages:
+            for description in pending_pages.popleft():
+                yield _record_description(description, metrics)
+    while pending_pages:
+        for description in pending_pages.popleft():
+            yield _record_description(description, metrics)
+
+
+def split_descriptions(descriptions: Iterable[Description], text_splitter, metrics: IngestionMetrics) -> Generator[Chunk, None, None]:
+    for material_id, material_description, properties in descriptions:
+        start_time = time.perf_counter()
+        description_chunks = text_splitter.split_text(material_description)
+        metrics.record("split", time.perf_counter() - start_time,
+                       docs=1, chunks=len(description_chunks))
+        for chunk_idx, description_chunk in enumerate(description_chunks):
+            yield (make_point_id(material_id, chunk_idx, description_chunk), material_id,
+                   chunk_idx, len(description_chunks), description_chunk, properties)
+
+
+def fit_projection_on_sample(
+    doc_pages: Iterable[list],
+    embedding_model: CustomEmbeddings,
+    text_splitter,
+    dimension: int,
+    sample_size: int = 4800
+) -> Tuple[PCAProjection, Iterable[list]]:
+    """
+    fits a projection on the embeddings of the first `sample_size` chunks of `doc_pages`, returns it with
+    the doc pages to ingest, including the pages read for the sample. with the embedding cache enabled,
+    the sample chunks are not run through the model a second time at ingest
+    """
+    assert embedding_model.projection is None, "the projection is fitted on full-width embeddings"
+    doc_pages = iter(doc_pages)
+    sample_pages = []
+    sample_chunks = []
+    for page in doc_pages:
+        sample_pages.append(page)
+        for doc in page:
+            _, material_description, _, _, _ = describe_doc(doc)
+            sample_chunks.extend(text_splitter.split_text(material_description))
+        if len(sample_chunks) >= sample_size:
+            break
+    print(f"{datetime.now()}: fitting a {dimension}-dimensional projection on {min(sample_size, len(sample_chunks))} chunks")
+    projection = PCAProjection.fit(
+        embedding_model.embed_documents_array(sample_chunks[:sample_size]), dimension)
+    return projection, itertools.chain(sample_pages, doc_pages)
+
+
+def batch_chunks(chunks: Iterable[Chunk], batch_size: int) -> Generator[List[Chunk], None, None]:
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def skip_committed_batches(batches: Iterable[List[Chunk]], checkpoint: Optional[IngestionCheckpoint], embedding_id: str) -> Generator[Tuple[str, List[Chunk]], None, None]:
+    skipped = 0
+    for batch in batches:
+        key = batch_key((point_id for point_id, *_ in batch), embedding_id)
+        if checkpoint is not None and key in checkpoint:
+            skipped += 1
+            continue
+        yield key, batch
+    print(f"{datetime.now()}: skipped {skipped} batches already committed by a previous run")
+
+
+def embed_batches(batches: Iterable[Tuple[str, List[Chunk]]], embedding_model: CustomEmbeddings):
+    for key, batch in batches:
+        embeddings = embedding_model.embed_documents_array(
+            [description_chunk for _, _, _, _, description_chunk, _ in batch])
+        yield key, batch, embeddings
+
+
+class BulkUploader:
+    """
+    Uploads batches of points from a pool of worker threads without waiting for Qdrant to apply them.
+
+    At most `max_pending` batches are in flight; `submit` blocks once that limit is reached,
+    which throttles the embedding stage instead of buffering points without bound. A failed
+    upload is retried with exponential backoff, and a batch is recorded in the checkpoint only
+    once Qdrant has acknowledged it. The points matching the `stale_points` filter of a batch are
+    deleted right after its upsert. `close` drains the pool and waits until every upload has
+    been applied.
+    """
+
+    def __init__(
+        self,
+        qdrant_client: QdrantClient,
+        collection_name: str,
+        checkpoint: Optional[IngestionCheckpoint],
+        workers: int = 4,
+        max_pending: int = 8,
+        max_retries: int = 3,
+        retry_delay: float = 1.,
+        metrics: Optional[IngestionMetrics] = None
+    ):
+        self._client = qdrant_client
+        self._collection_name = collection_name
+        self._checkpoint = checkpoint
+        self._metrics = metrics
+        self._max_retries = max_retries
+        self._retry_delay = retry_delay
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="upload")
+        self._slots = threading.BoundedSemaphore(max(max_pending, workers))
+        self._error: BaseException = None
+        self._last_batch: Batch = None
+
+    def submit(
+        self,
+        key: str,
+        ids: List[str],
+        vectors: Union[np.ndarray, dict],
+        payloads: List[dict],
+        stale_points: Optional[models.Filter] = None
+    ):
+        """queues one batch of points, `vectors` (an array, or named vectors) is handed to the Qdrant client as is"""
+        if self._error is not None:
+            raise self._error
+        self._slots.acquire()
+        future = self._executor.submit(
+            self._upload, key, ids, vectors, payloads, stale_points)
+        future.add_done_callback(self._on_done)
+
+    def _upload(
+        self,
+        key: str,
+        ids: List[str],
+        vectors: Union[np.ndarray, dict],
+        payloads: List[dict],
+        stale_points: Optional[models.Filter]
+    ):
+        # the batch model turns the array into the request body, this runs on the worker thread
+        points = Batch(ids=ids, vectors=vectors, payloads=payloads)
+        for attempt in range(self._max_retries + 1):
+            try:
+                start_time = time.perf_counter()
+                self._client.upsert(
+                    collection_name=self._collection_name,
+                    points=points,
+                    wait=False
+                )
+                if stale_points is not None:
+                    # applied after the upsert, a retry upserts the batch again and deletes nothing new
+                    self._client.delete(
+                        collection_name=self._collection_name,
+                        points_selector=models.FilterSelector(filter=stale_points),
+                        wait=False
+                    )
+                if self._metrics is not None:
+                    self._metrics.record(
+                        "upsert", time.perf_counter() - start_time, chunks=len(ids))
+                break
+            except Exception as e:
+                if attempt == self._max_retries:
+                    raise
+                delay = self._retry_delay * 2 ** attempt
+                print(f"{datetime.now()}: uploading {len(ids)} points failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+        self._last_batch = points
+        if self._checkpoint is not None:
+            self._checkpoint.mark_committed(key)
+        print(f"{datetime.now()}: {len(ids)} points inserted to Qdrant.")
+
+    def _on_done(self, future):
+        self._slots.release()
+        if future.exception() is not None and self._error is None:
+            self._error = future.exception()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._error is not None:
+            raise self._error
+        if self._last_batch is not None:
+            # Qdrant applies the updates of a collection in order, so once this (idempotent)
+            # upsert has been applied, every upload acknowledged before it has been applied too
+            self._client.upsert(
+                collection_name=self._collection_name,
+                points=self._last_batch,
+                wait=True
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def stream_embedded_batches(
+    doc_pages: Iterable[list],
+    embedding_model: CustomEmbeddings,
+    text_splitter,
+    checkpoint: Optional[IngestionCheckpoint] = None,
+    batch_size: int = 1600,
+    queue_size: int = 2,
+    format_pool: Executor = None,
+    format_chunksize: int = 16,
+    metrics: Optional[IngestionMetrics] = None
+) -> Generator[Tuple[str, List[Chunk], np.ndarray], None, None]:
+    """
+    streaming pipeline: download -> format/normalize -> split -> embed, yielding (batch key, chunks, embeddings).
+    each arrow is a bounded queue, so the stages overlap and memory stays flat.
+    formatting and normalization run in `format_pool` when given, else in the pipeline thread.
+    batches already recorded in `checkpoint` are skipped before they reach the model.
+    pass `metrics` to collect per-stage timings, the model stages are timed by `embedding_model` itself
+    """
+    metrics = metrics or IngestionMetrics()
+    doc_pages = run_in_background(
+        metrics.timed_iter("download", doc_pages, docs=len), maxsize=queue_size, name="download")
+    descriptions = (
+        describe_docs_in_pool(doc_pages, format_pool, metrics,
+                              chunksize=format_chunksize, max_pending_pages=queue_size)
+        if format_pool is not None
+        else describe_docs(doc_pages, metrics)
+    )
+    batches = skip_committed_batches(
+        batch_chunks(split_descriptions(
+            descriptions, text_splitter, metrics), batch_size),
+        checkpoint,
+        embedding_model.embedding_id
+    )
+    batches = run_in_background(batches, maxsize=queue_size, name="format")
+    return run_in_background(
+        embed_batches(batches, embedding_model), maxsize=queue_size, name="embed")
+
+
+def ingest(
+    embedded_batches: Iterable[Tuple[str, List[Chunk], np.ndarray]],
+    qdrant_client: QdrantClient,
+    collection_name: str,
+    checkpoint: Optional[IngestionCheckpoint],
+    upload_workers: int = 4,
+    max_pending_uploads: int = 8,
+    metrics: Optional[IngestionMetrics] = None,
+    sparse_vectors: bool = True
+):
+    """
+    uploads the output of `stream_embedded_batches` to `collection_name`, along with the BM25 vectors
+    of hybrid search unless `sparse_vectors` is off. the chunks a previous run stored for the uploaded
+    materials and that are no longer part of their descriptions are deleted
+    """
+    uploader = BulkUploader(
+        qdrant_client, collection_name, checkpoint,
+        workers=upload_workers, max_pending=max_pending_uploads, metrics=metrics
+    )
+    with uploader:
+        for key, batch, batch_embeddings in embedded_batches:
+            # upsert with deterministic ids is idempotent
+            uploader.submit(
+                key,
+                [point_id for point_id, *_ in batch],
+                {
+                    "": batch_embeddings,
+                    SPARSE_VECTOR_NAME: [bm25_document_vector(description_chunk)
+                                         for _, _, _, _, description_chunk, _ in batch]
+                } if sparse_vectors else batch_embeddings,
+                [
+                    {
+                        "material_id": material_id,
+                        "chunk_idx": chunk_idx,
+                        "page_content": description_chunk,
+                        **properties
+                    } for _, material_id, chunk_idx, _, description_chunk, properties in batch
+                ],
+                stale_chunk_filter(chunk[:4] for chunk in batch)
+            )
+# endregion
+
+
+__all__ = ["make_point_id", "batch_key", "IngestionCheckpoint",
+           "run_in_background", "download_summary_docs", "start_format_pool", "fit_projection_on_sample",
+           "stream_embedded_batches", "BulkUploader", "ingest"]
@@ -0,0 +1,92 @@
+from contextlib import contextmanager
+import threading
+import time
+from typing import Callable, Generator, Iterable, TypeVar
+
+T = TypeVar("T")
+
+# pipeline stages in the order they are reported
+STAGES = ("download", "format", "normalize", "split",
+          "tokenize", "model forward", "upsert")
+
+
+class StageMetrics:
+    def __init__(self):
+        self.seconds = 0.
+        self.calls = 0
+        self.docs = 0
+        self.chunks = 0
+        self.tokens = 0
+
+
+class IngestionMetrics:
+    """
+    Thread-safe counters and busy-time timers for each ingestion stage.
+
+    The rates in the report are per busy second of a stage, i.e. how fast the stage itself is,
+    independent of how long it waited for its neighbours. Stages running in a process pool add
+    up the busy time of all workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {stage: StageMetrics() for stage in STAGES}
+        self._start_time = time.perf_counter()
+
+    def record(self, stage: str, seconds: float, docs: int = 0, chunks: int = 0, tokens: int = 0):
+        with self._lock:
+            metrics = self._stages.setdefault(stage, StageMetrics())
+            metrics.seconds += seconds
+            metrics.calls += 1
+            metrics.docs += docs
+            metrics.chunks += chunks
+            metrics.tokens += tokens
+
+    @contextmanager
+    def time(self, stage: str, docs: int = 0, chunks: int = 0, tokens: int = 0):
+        start_time = time.perf_counter()
+        yield
+        self.record(stage, time.perf_counter() - start_time,
+                    docs=docs, chunks=chunks, tokens=tokens)
+
+    def timed_iter(self, stage: str, iterable: Iterable[T], docs: Callable[[T], int] = None) -> Generator[T, None, None]:
+        """times every `next` on `iterable`, e.g. to measure a download that happens lazily"""
+        iterator = iter(iterable)
+        while True:
+            start_time = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.record(stage, time.perf_counter() - start_time,
+                        docs=docs(item) if docs else 0)
+            yield item
+
+    def __getitem__(self, stage: str) -> StageMetrics:
+        return self._stages[stage]
+
+    def report(self) -> str:
+        wall_seconds = time.perf_counter() - self._start_time
+        lines = [
+            f"{'stage':<14}{'busy s':>10}{'docs/s':>12}{'chunks/s':>12}{'tokens/s':>14}"]
+        with self._lock:
+            for stage, metrics in self._stages.items():
+                if not metrics.calls:
+                    continue
+
+                def rate(count):
+                    return f"{count / metrics.seconds:.1f}" if count and metrics.seconds else "-"
+                lines.append(
+                    f"{stage:<14}{metrics.seconds:>10.2f}{rate(metrics.docs):>12}"
+                    f"{rate(metrics.chunks):>12}{rate(metrics.tokens):>14}"
+                )
+            docs = max(metrics.docs for metrics in self._stages.values())
+            chunks = max(metrics.chunks for metrics in self._stages.values())
+        lines.append(
+            f"total: {docs} docs, {chunks} chunks in {wall_seconds:.2f}s wall time "
+            f"({docs / wall_seconds:.1f} docs/s, {chunks / wall_seconds:.1f} chunks/s)"
+        )
+        return "\n".join(lines)
+
+
+__all__ = ["IngestionMetrics", "STAGES"]
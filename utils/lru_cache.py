@@ -0,0 +1,64 @@
+from collections import OrderedDict
+import threading
+import time
+from typing import Generic, Hashable, Optional, TypeVar
+
+V = TypeVar("V")
+
+
+class LRUCache(Generic[V]):
+    """
+    Bounded, thread-safe least-recently-used cache with an optional time to live.
+
+    Entries older than `ttl` seconds count as misses and are dropped when they are looked up,
+    the least recently used entry is evicted once `maxsize` entries are stored.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        assert maxsize > 0, "maxsize should be positive"
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._ttl is not None and time.monotonic() - entry[0] > self._ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: V):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.
+
+    def __repr__(self):
+        return (f"LRUCache(size={len(self)}/{self._maxsize}, hits={self.hits}, "
+                f"misses={self.misses}, hit_rate={self.hit_rate:.2f})")
+
+
+__all__ = ["LRUCache"]
@@ -0,0 +1,132 @@
+from __future__ import annotations
+import re
+from typing import TYPE_CHECKING, NamedTuple, Optional, Union
+
+if TYPE_CHECKING:
+    from emmet.core.summary import SummaryDoc
+
+# typed summary doc fields stored as payload next to each chunk, so searches can filter on them
+NUMERIC_PROPERTIES = ("band_gap", "energy_above_hull", "formation_energy_per_atom",
+                      "bulk_modulus", "shear_modulus")
+BOOLEAN_PROPERTIES = ("is_stable", "is_metal", "is_gap_direct", "theoretical")
+
+# how the numeric properties are written in questions
+_NUMERIC_PROPERTY_NAMES = {
+    "band_gap": r"band[ -]?gaps?",
+    "energy_above_hull": r"(?:energy|energies) above (?:the )?(?:convex )?hull|e[ _]?above[ _]?hull|hull energy",
+    "formation_energy_per_atom": r"formation energy|formation energies",
+    "bulk_modulus": r"bulk modul(?:us|i)",
+    "shear_modulus": r"shear modul(?:us|i)",
+}
+_NUMBER = r"(-?\d+(?:\.\d+)?)\s*(mev|ev|gpa)?"
+_LOWER_BOUND = r">=|≥|>|at least|no less than|(?:greater|more|larger|higher) than|above|over|exceeding|min(?:imum)?(?: of)?"
+_UPPER_BOUND = r"<=|≤|<|at most|no more than|(?:less|smaller|lower) than|below|under|up to|max(?:imum)?(?: of)?"
+_CONSTRAINT = (
+    r"(?:\s+(?:of|is|are|in the range(?: of)?|values?|with))*\s*"
+    rf"(?:(?:between|from)\s*{_NUMBER}\s*(?:and|to|-|–)\s*{_NUMBER}"
+    rf"|(?P<op>{_LOWER_BOUND}|{_UPPER_BOUND})\s*{_NUMBER}"
+    rf"|{_NUMBER}\s*(?:-|–|to)\s*{_NUMBER})"
+)
+# what the questions ask for, "stable oxides" restricts the results while "how stable is LiFePO4?" does not
+_RESULT_NOUN = (r"(?:materials?|compounds?|phases?|structures?|crystals?|solids?|ones|candidates|systems|"
+                r"oxides|alloys|semiconductors|insulators|metals)")
+# words that may stand between an adjective and the noun, e.g. "stable non-metallic materials"
+_NOUN_MODIFIER = r"(?!(?:is|are|was|were|be|the|a|an|this|that|these|those|its|their)\b)[\w-]+"
+
+
+def _restricting(adjective: str) -> str:
+    # "stable materials", "only stable" or "compounds that are stable"
+    return (rf"\b(?:{adjective})(?:\s+{_NOUN_MODIFIER}){{0,2}}?\s+{_RESULT_NOUN}\b"
+            rf"|\b(?:only|exclusively)\s+(?:{adjective})\b"
+            rf"|\b{_RESULT_NOUN}\s+(?:that|which)\s+are\s+(?:{adjective})\b")
+
+
+_BOOLEAN_PATTERNS = [
+    ("is_stable", False, _restricting(r"unstable|not stable|non-?stable|metastable")),
+    ("is_stable", True, _restricting(r"stable")),
+    ("is_metal", False, _restricting(r"non-?metallic|not metallic|insulating|semiconducting")
+     + r"|\b(?:insulators|semiconductors)\b"),
+    ("is_metal", True, _restricting(r"metallic")),
+    ("is_gap_direct", False, _restricting(r"indirect(?: band)?[ -]gaps?")
+     + r"|\bwith\s+(?:an?\s+)?indirect (?:band[ -]?)?gaps?\b"),
+    ("is_gap_direct", True, _restricting(r"direct(?: band)?[ -]gaps?")
+     + r"|\bwith\s+(?:an?\s+)?direct (?:band[ -]?)?gaps?\b"),
+]
+
+
+class PropertyConstraint(NamedTuple):
+    key: str
+    # inclusive bounds of a numeric property
+    gte: Optional[float] = None
+    lte: Optional[float] = None
+    # required value of a boolean property
+    value: Optional[bool] = None
+
+    def __str__(self):
+        if self.value is not None:
+            return f"{self.key} = {self.value}"
+        if self.gte is not None and self.lte is not None:
+            return f"{self.gte} <= {self.key} <= {self.lte}"
+        if self.gte is not None:
+            return f"{self.key} >= {self.gte}"
+        return f"{self.key} <= {self.lte}"
+
+
+def summary_doc_properties(doc: SummaryDoc) -> dict[str, Union[float, bool]]:
+    """the `NUMERIC_PROPERTIES` and `BOOLEAN_PROPERTIES` of `doc` that are set, moduli are the VRH averages in GPa"""
+    properties = {}
+    for key in NUMERIC_PROPERTIES:
+        value = getattr(doc, key, None)
+        if isinstance(value, dict):
+            value = value.get("vrh")
+        if value is not None:
+            properties[key] = float(value)
+    for key in BOOLEAN_PROPERTIES:
+        value = getattr(doc, key, None)
+        if value is not None:
+            properties[key] = bool(value)
+    return properties
+
+
+def _scaled(number: str, unit: Optional[str]) -> float:
+    return float(number) / 1000 if unit and unit.lower() == "mev" else float(number)
+
+
+def _scaled_range(low: str, low_unit: Optional[str], high: str, high_unit: Optional[str]) -> list[float]:
+    # "between 10 and 50 meV", the unit written on one bound applies to both
+    return sorted([_scaled(low, low_unit or high_unit), _scaled(high, high_unit or low_unit)])
+
+
+def extract_property_constraints(text: str) -> list[PropertyConstraint]:
+    """
+    constraints on the typed properties written in `text`, e.g. "band gap between 1 and 2 eV",
+    "energy above hull below 50 meV" or "stable non-metallic materials"
+    """
+    constraints = []
+    for key, name_pattern in _NUMERIC_PROPERTY_NAMES.items():
+        match = re.search(
+            rf"\b(?:{name_pattern}){_CONSTRAINT}", text, flags=re.IGNORECASE)
+        if not match:
+            continue
+        groups = match.groups()
+        if groups[0] is not None:
+            bounds = _scaled_range(*groups[0:4])
+        elif match.group("op") is not None:
+            bound = _scaled(*groups[5:7])
+            is_lower_bound = re.fullmatch(
+                _LOWER_BOUND, match.group("op"), flags=re.IGNORECASE)
+            bounds = [bound, None] if is_lower_bound else [None, bound]
+        else:
+            bounds = _scaled_range(*groups[7:11])
+        constraints.append(PropertyConstraint(key, gte=bounds[0], lte=bounds[1]))
+    matched_keys = set()
+    for key, value, pattern in _BOOLEAN_PATTERNS:
+        # the negated patterns come first, "unstable" must not also count as "stable"
+        if key not in matched_keys and re.search(pattern, text, flags=re.IGNORECASE):
+            matched_keys.add(key)
+            constraints.append(PropertyConstraint(key, value=value))
+    return constraints
+
+
+__all__ = ["NUMERIC_PROPERTIES", "BOOLEAN_PROPERTIES", "PropertyConstraint",
+           "summary_doc_properties", "extract_property_constraints"]
@@ -0,0 +1,90 @@
+from concurrent.futures import Future
+import queue
+import threading
+import time
+from typing import Callable, List
+import numpy as np
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Collects texts submitted concurrently from many threads into micro-batches for one worker thread.
+
+    A batch is closed once it holds `max_batch_size` distinct texts or `max_wait` seconds after its
+    first text arrived, whichever comes first, and is embedded with a single `embed_batch` call.
+    A lone request therefore waits at most `max_wait` seconds longer than it would without batching.
+    """
+
+    def __init__(self, embed_batch: Callable[[List[str]], np.ndarray], max_batch_size: int = 16, max_wait: float = .005):
+        self._embed_batch = embed_batch
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+        self._queue: queue.Queue = queue.Queue()
+        # counters to check how well requests are batched: requests / batches is the mean batch size
+        self.requests = 0
+        self.batches = 0
+        self._thread = threading.Thread(
+            target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed(self, text: str) -> np.ndarray:
+        return self.submit(text).result()
+
+    def _next_batch(self) -> tuple[dict[str, list[Future]], bool]:
+        """waits for the next batch, maps every distinct text to the futures waiting for it"""
+        item = self._queue.get()
+        if item is _STOP:
+            return {}, True
+        batch = {item[0]: [item[1]]}
+        deadline = time.monotonic() + self._max_wait
+        while len(batch) < self._max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.setdefault(item[0], []).append(item[1])
+        return batch, False
+
+    def _run(self):
+        stopped = False
+        while not stopped:
+            batch, stopped = self._next_batch()
+            if not batch:
+                continue
+            texts = list(batch.keys())
+            try:
+                embeddings = self._embed_batch(texts)
+            except BaseException as exc:
+                for futures in batch.values():
+                    for future in futures:
+                        future.set_exception(exc)
+                continue
+            self.requests += sum(len(futures) for futures in batch.values())
+            self.batches += 1
+            for text, embedding in zip(texts, embeddings):
+                for future in batch[text]:
+                    future.set_result(embedding)
+
+    def close(self):
+        """embeds what is already queued and stops the worker thread"""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def __repr__(self):
+        mean_batch_size = self.requests / self.batches if self.batches else 0.
+        return f"MicroBatcher(requests={self.requests}, batches={self.batches}, mean_batch_size={mean_batch_size:.2f})"
+
+
+__all__ = ["MicroBatcher"]
@@ -0,0 +1,62 @@
+from datetime import datetime
+from functools import lru_cache
+import gzip
+from typing import Generator, Iterable
+import msgpack
+from emmet.core.summary import SummaryDoc
+from monty.json import jsanitize
+from pydantic import TypeAdapter, ValidationError
+from utils.atomic_files import atomic_output_path
+
+# snapshot layout: a gzip compressed stream of msgpack objects, one list of summary doc records per page
+
+
+def save_summary_snapshot(doc_pages: Iterable[list], path: str) -> Generator[list, None, None]:
+    """
+    passes `doc_pages` through unchanged while writing them to a snapshot at `path`.
+    the snapshot is written to a temporary file and only moved into place once every page
+    has been consumed, so an interrupted download never leaves a truncated snapshot behind
+    """
+    packer = msgpack.Packer()
+    doc_count = 0
+    with atomic_output_path(path) as tmp_path, gzip.open(tmp_path, "wb", compresslevel=6) as f:
+        for page in doc_pages:
+            # pydantic cannot serialize the pymatgen objects (e.g. Structure) in json mode,
+            # they are stored as their MSONable dicts and validated back into objects on load
+            f.write(packer.pack([
+                jsanitize(doc.model_dump(mode="python", exclude_none=True), strict=True, enum_values=True)
+                for doc in page
+            ]))
+            doc_count += len(page)
+            yield page
+    print(f"{datetime.now()}: saved {doc_count} summary docs to {path}")
+
+
+@lru_cache(maxsize=None)
+def _field_adapter(field_name: str) -> TypeAdapter:
+    return TypeAdapter(SummaryDoc.model_fields[field_name].annotation)
+
+
+def _restore_summary_doc(record: dict) -> SummaryDoc:
+    # the full document model is not validated because of https://github.com/materialsproject/api/issues/922,
+    # fields are restored one by one and kept as stored when they fail to validate
+    fields = {}
+    for field_name, value in record.items():
+        if field_name not in SummaryDoc.model_fields:
+            continue
+        try:
+            value = _field_adapter(field_name).validate_python(value)
+        except ValidationError:
+            pass
+        fields[field_name] = value
+    return SummaryDoc.model_construct(**fields)
+
+
+def load_summary_snapshot(path: str) -> Generator[list[SummaryDoc], None, None]:
+    """yields the pages of summary docs stored in the snapshot at `path`, without touching the network"""
+    with gzip.open(path, "rb") as f:
+        for page in msgpack.Unpacker(f, raw=False, max_buffer_size=0):
+            yield [_restore_summary_doc(record) for record in page]
+
+
+__all__ = ["save_summary_snapshot", "load_summary_snapshot"]
@@ -0,0 +1,124 @@
+from datetime import datetime
+import os
+from types import SimpleNamespace
+from typing import Callable, List
+import torch
+from utils.atomic_files import atomic_output_path
+
+# exported encoders are cached as <EMBEDDING_ONNX_DIR>/<model name>/model.onnx, with the
+# dynamically quantized graph next to it as model.int8.onnx
+ONNX_FILE_NAME = "model.onnx"
+ONNX_INT8_FILE_NAME = "model.int8.onnx"
+ONNX_OPSET_VERSION = 17
+
+
+class _FirstOutput(torch.nn.Module):
+    # the exported graph takes the tokenizer outputs positionally and returns only the last hidden state
+    def __init__(self, model: torch.nn.Module, input_names: List[str]):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *inputs):
+        return self.model(**dict(zip(self.input_names, inputs)))[0]
+
+
+def export_onnx_encoder(model: torch.nn.Module, tokenizer, path: str):
+    """exports `model` to `path` with dynamic batch and sequence axes for every tokenizer output"""
+    dummy_inputs = tokenizer(["material science", "band gap"],
+                             padding=True, return_tensors="pt")
+    input_names = list(dummy_inputs.keys())
+    with atomic_output_path(path) as tmp_path, torch.inference_mode():
+        torch.onnx.export(
+            _FirstOutput(model.to("cpu").eval(), input_names),
+            tuple(dummy_inputs[name] for name in input_names),
+            tmp_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                **{name: {0: "batch", 1: "sequence"} for name in input_names},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=ONNX_OPSET_VERSION,
+            dynamo=False
+        )
+    print(f"{datetime.now()}: exported {getattr(model, 'name_or_path', type(model).__name__)} to {path}")
+
+
+def quantize_onnx_encoder(path: str, quantized_path: str):
+    """writes a copy of the graph at `path` with int8 weights for the MatMul/Gemm nodes"""
+    import onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    with atomic_output_path(quantized_path) as tmp_path:
+        # given a path, the shape inference writes a fixed "-inferred" file next to it, given the
+        # loaded graph it works in a temp directory of its own
+        quantize_dynamic(onnx.load(path), tmp_path, weight_type=QuantType.QInt8)
+    print(f"{datetime.now()}: quantized {path} to {quantized_path}")
+
+
+class OnnxEncoder:
+    """
+    Runs an exported encoder on ONNX Runtime's CPU execution provider.
+
+    It is called like the torch model it was exported from and returns the last hidden state
+    as a tensor, so `CustomEmbeddings` can use either one without knowing which it got.
+    """
+
+    def __init__(self, path: str, name_or_path: str, precision: str = "fp32",
+                 intra_op_threads: int = 0, inter_op_threads: int = 0):
+        # only needed when the ONNX backend is selected
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 0 keeps the ONNX Runtime defaults
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        self._session = onnxruntime.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"])
+        self._input_names = [
+            session_input.name for session_input in self._session.get_inputs()]
+        self.name_or_path = name_or_path
+        self.precision = precision
+        self.device = torch.device("cpu")
+        self.config = SimpleNamespace(
+            hidden_size=self._session.get_outputs()[0].shape[-1])
+
+    def eval(self) -> "OnnxEncoder":
+        return self
+
+    def __call__(self, **inputs: torch.Tensor):
+        last_hidden_state = self._session.run(None, {
+            name: inputs[name].numpy() for name in self._input_names
+        })[0]
+        return (torch.from_numpy(last_hidden_state),)
+
+
+def load_onnx_encoder(
+    model_name: str,
+    load_model: Callable[[], torch.nn.Module],
+    tokenizer,
+    cache_dir: str,
+    quantize_int8: bool = False,
+    intra_op_threads: int = 0,
+    inter_op_threads: int = 0
+) -> OnnxEncoder:
+    """
+    loads the exported `model_name` from `cache_dir`. the torch model is only loaded through
+    `load_model` the first time, to export it
+    """
+    model_dir = os.path.join(cache_dir, model_name.replace("/", "--"))
+    path = os.path.join(model_dir, ONNX_FILE_NAME)
+    if not os.path.exists(path):
+        export_onnx_encoder(load_model(), tokenizer, path)
+    # int8 graphs are quantized differently than the torch int8 models, so their embeddings are tagged apart
+    if quantize_int8:
+        quantized_path = os.path.join(model_dir, ONNX_INT8_FILE_NAME)
+        if not os.path.exists(quantized_path):
+            quantize_onnx_encoder(path, quantized_path)
+        path = quantized_path
+    return OnnxEncoder(path, model_name, "onnx-int8" if quantize_int8 else "fp32",
+                       intra_op_threads, inter_op_threads)
+
+
+__all__ = ["OnnxEncoder", "export_onnx_encoder",
+           "quantize_onnx_encoder", "load_onnx_encoder"]
@@ -0,0 +1,22 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+from typing import Callable, Optional
+
+
+def start_process_pool(workers: int, initializer: Optional[Callable] = None, initargs: tuple = ()) -> ProcessPoolExecutor:
+    """
+    process pool whose workers are forked (where available) and started right away from the calling
+    thread, before the pipeline threads exist or a model is loaded. returns once every worker has run
+    `initializer`
+    """
+    mp_context = multiprocessing.get_context(
+        "fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+    pool = ProcessPoolExecutor(
+        max_workers=workers, mp_context=mp_context, initializer=initializer, initargs=initargs)
+    for future in [pool.submit(os.getpid) for _ in range(workers)]:
+        future.result()
+    return pool
+
+
+__all__ = ["start_process_pool"]
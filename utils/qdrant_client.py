@@ -2,7 +2,16 @@ from qdrant_client import QdrantClient
 import config
 
 
+def is_embedded_qdrant() -> bool:
+    """whether `get_qdrant_client` runs Qdrant in-process instead of connecting to a server"""
+    return bool(config.QDRANT_PATH)
+
+
 def get_qdrant_client():
+    if is_embedded_qdrant():
+        print(f'config.QDRANT_PATH: {config.QDRANT_PATH}')
+        # searched in-process, without a server or a network hop
+        return QdrantClient(path=config.QDRANT_PATH)
     print(f'config.USE_LOCAL_QDRANT: {config.USE_LOCAL_QDRANT}')
     if config.USE_LOCAL_QDRANT:
         return QdrantClient(
@@ -0,0 +1,57 @@
+from datetime import datetime
+import threading
+import time
+from typing import Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class LazyResource(Generic[T]):
+    """
+    Process-wide resource, e.g. a model or a client, created by `factory` on first use.
+
+    Creation happens once per process even when several threads (Streamlit sessions) ask for the
+    resource at the same time. `warm_up` creates it in a background thread ahead of its first use.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T]):
+        self._name = name
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._value: Optional[T] = None
+        self._created = False
+        self._warm_up_thread: Optional[threading.Thread] = None
+
+    def get(self) -> T:
+        if self._created:
+            return self._value
+        with self._lock:
+            if not self._created:
+                start_time = time.perf_counter()
+                self._value = self._factory()
+                self._created = True
+                print(f"{datetime.now()}: created {self._name} in {time.perf_counter() - start_time:.2f}s")
+        return self._value
+
+    @property
+    def created(self) -> bool:
+        return self._created
+
+    def warm_up(self):
+        """creates the resource in a daemon thread, only the first call starts one"""
+        with self._lock:
+            if self._created or self._warm_up_thread is not None:
+                return
+            self._warm_up_thread = threading.Thread(
+                target=self._warm_up, name=f"warm-up {self._name}", daemon=True)
+            self._warm_up_thread.start()
+
+    def _warm_up(self):
+        try:
+            self.get()
+        except Exception as exc:
+            # the error is raised again on the first `get`, which retries the creation
+            print(f"{datetime.now()}: warming up {self._name} failed: {exc}")
+
+
+__all__ = ["LazyResource"]
@@ -0,0 +1,62 @@
+from typing import Iterable, List, Optional
+from langchain_core.documents import Document
+from qdrant_client import QdrantClient, models
+from utils.material_properties import PropertyConstraint
+
+
+def lookup_material_chunks(
+    qdrant_client: QdrantClient,
+    collection_name: str,
+    material_ids: List[str],
+    page_size: int = 256
+) -> List[Document]:
+    """
+    all chunks of the given materials, fetched with a filtered scroll over the material_id index
+    without embedding a query or searching the vectors, grouped in the order of `material_ids`
+    and in the order of the description within each material
+    """
+    if not material_ids:
+        return []
+    points_filter = models.Filter(must=[models.FieldCondition(
+        key="material_id", match=models.MatchAny(any=list(material_ids)))])
+    points = []
+    offset = None
+    while True:
+        page, offset = qdrant_client.scroll(
+            collection_name=collection_name,
+            scroll_filter=points_filter,
+            limit=page_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=False
+        )
+        points.extend(page)
+        if offset is None:
+            break
+    material_order = {material_id: idx for idx,
+                      material_id in enumerate(material_ids)}
+    # points stored before the chunk index was added keep the scroll order
+    points.sort(key=lambda point: (
+        material_order[point.payload["material_id"]], point.payload.get("chunk_idx", 0)))
+    return [
+        Document(
+            page_content=point.payload["page_content"],
+            metadata={"material_id": point.payload["material_id"],
+                      "_id": point.id, "_collection_name": collection_name}
+        )
+        for point in points
+    ]
+
+
+def property_filter(constraints: Iterable[PropertyConstraint]) -> Optional[models.Filter]:
+    """Qdrant filter matching the points that satisfy every constraint, None without constraints"""
+    conditions = [
+        models.FieldCondition(key=constraint.key, match=models.MatchValue(value=constraint.value))
+        if constraint.value is not None
+        else models.FieldCondition(key=constraint.key, range=models.Range(gte=constraint.gte, lte=constraint.lte))
+        for constraint in constraints
+    ]
+    return models.Filter(must=conditions) if conditions else None
+
+
+__all__ = ["lookup_material_chunks", "property_filter"]
@@ -0,0 +1,119 @@
+from datetime import datetime, timezone
+import threading
+import time
+from typing import Callable, Hashable, Iterable, List, Optional, Tuple
+import uuid
+from langchain_core.documents import Document
+from qdrant_client import QdrantClient, models
+from utils.lru_cache import LRUCache
+from utils.text_normalizer import get_text_normalizer
+
+# the version of a collection is the payload of the single point of "<collection>_version"
+VERSION_COLLECTION_SUFFIX = "_version"
+_VERSION_POINT_ID = 0
+
+
+def write_collection_version(qdrant_client: QdrantClient, collection_name: str) -> str:
+    """marks `collection_name` as changed, retrieval caches drop the results read before"""
+    version_collection_name = collection_name + VERSION_COLLECTION_SUFFIX
+    if not qdrant_client.collection_exists(collection_name=version_collection_name):
+        qdrant_client.create_collection(
+            collection_name=version_collection_name,
+            vectors_config=models.VectorParams(size=1, distance=models.Distance.DOT))
+    version = uuid.uuid4().hex
+    qdrant_client.upsert(
+        collection_name=version_collection_name,
+        points=[models.PointStruct(id=_VERSION_POINT_ID, vector=[0.], payload={
+            "version": version, "updated_at": datetime.now(timezone.utc).isoformat()})],
+        wait=True
+    )
+    print(f"{datetime.now()}: {collection_name} is now at version {version}")
+    return version
+
+
+def read_collection_version(qdrant_client: QdrantClient, collection_name: str) -> Optional[str]:
+    """the version written by the last `write_collection_version`, None if it was never written"""
+    version_collection_name = collection_name + VERSION_COLLECTION_SUFFIX
+    if not qdrant_client.collection_exists(collection_name=version_collection_name):
+        return None
+    points = qdrant_client.retrieve(
+        collection_name=version_collection_name, ids=[_VERSION_POINT_ID], with_payload=True)
+    return points[0].payload["version"] if points else None
+
+
+def normalize_search_query(search_query: str) -> str:
+    """questions that differ only in case, accents or spacing share their cached results"""
+    return " ".join(get_text_normalizer().normalize(search_query).lower().split())
+
+
+class RetrievalCache:
+    """
+    Process-wide cache of the documents retrieved for a search, keyed by the normalized query, the
+    material IDs, the property constraints and k.
+
+    Every key also holds the collection version, read with `read_version` at most once every
+    `version_check_interval` seconds. Once the collection is re-ingested the version changes and
+    the results read before are dropped, entries also expire after `ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: Optional[float] = None,
+        read_version: Callable[[], Optional[str]] = lambda: None,
+        version_check_interval: float = 30.
+    ):
+        self._cache: LRUCache[Tuple[Document, ...]] = LRUCache(maxsize, ttl)
+        self._read_version = read_version
+        self._version_check_interval = version_check_interval
+        self._version: Optional[str] = None
+        self._version_checked_at: Optional[float] = None
+        self._version_lock = threading.Lock()
+
+    def _current_version(self) -> Optional[str]:
+        with self._version_lock:
+            now = time.monotonic()
+            if self._version_checked_at is None or now - self._version_checked_at >= self._version_check_interval:
+                version = self._read_version()
+                if self._version_checked_at is not None and version != self._version:
+                    print(f"{datetime.now()}: collection version changed, clearing the retrieval cache")
+                    self._cache.clear()
+                self._version = version
+                self._version_checked_at = now
+            return self._version
+
+    def key(self, search_query: str, material_ids: Iterable[str] = (), constraints: Iterable = (), k: int = 0) -> Hashable:
+        # material ID lookups do not depend on the query or k
+        if material_ids:
+            return self._current_version(), tuple(material_ids)
+        return (self._current_version(), normalize_search_query(search_query),
+                tuple(sorted(constraints)), k)
+
+    def get(self, key: Hashable) -> Optional[List[Document]]:
+        docs = self._cache.get(key)
+        return list(docs) if docs is not None else None
+
+    def put(self, key: Hashable, docs: List[Document]):
+        self._cache.put(key, tuple(docs))
+
+    @property
+    def hits(self) -> int:
+        return self._cache.hits
+
+    @property
+    def misses(self) -> int:
+        return self._cache.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return self._cache.hit_rate
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __repr__(self):
+        return f"RetrievalCache(version={self._version}, cache={self._cache!r})"
+
+
+__all__ = ["write_collection_version", "read_collection_version",
+           "normalize_search_query", "RetrievalCache"]
@@ -0,0 +1,78 @@
+from collections import Counter
+import re
+import zlib
+from typing import List
+from langchain_qdrant.sparse_embeddings import SparseEmbeddings, SparseVector
+from qdrant_client import models
+from utils.text_normalizer import get_text_normalizer
+
+# name of the sparse vector stored next to the dense MatSciBERT vector of every point
+SPARSE_VECTOR_NAME = "bm25"
+
+# BM25 term frequency saturation and length normalization. the IDF factor is applied by Qdrant
+# over the whole collection (`Modifier.IDF`), so only the per-chunk weights are computed here
+BM25_K1 = 1.2
+BM25_B = .75
+# typical number of terms in a chunk, stands in for the collection average of BM25
+AVERAGE_CHUNK_TERMS = 100
+
+# words, numbers, formulas and symbols joined by "_", "/", ".", "+" or "-" are kept as one term,
+# e.g. "fe2o3", "p6_3/mmc", "mp-149" or "1.25"
+_TERM_PATTERN = re.compile(r"[a-z0-9]+(?:[_/.+\-][a-z0-9]+)*")
+# frequent question words that carry no meaning for the lexical match
+_STOP_WORDS = frozenset("""
+a an and are as at be by can do does for from has have how i in is it its me of on or show tell that
+the their there these this to was what which who why with find list give materials material
+""".split())
+
+
+def lexical_terms(text: str) -> List[str]:
+    return _TERM_PATTERN.findall(text.lower())
+
+
+def _term_index(term: str) -> int:
+    # stable across processes and runs, unlike `hash`
+    return zlib.crc32(term.encode("utf-8")) & 0x7FFFFFFF
+
+
+def _sparse_vector(term_weights: dict) -> models.SparseVector:
+    weights = {}
+    for term, weight in term_weights.items():
+        # colliding terms share their index
+        index = _term_index(term)
+        weights[index] = weights.get(index, 0.) + weight
+    return models.SparseVector(indices=list(weights), values=list(weights.values()))
+
+
+def bm25_document_vector(text: str) -> models.SparseVector:
+    """BM25 term weights of a chunk of the collection"""
+    terms = lexical_terms(text)
+    length_norm = BM25_K1 * (1 - BM25_B + BM25_B * len(terms) / AVERAGE_CHUNK_TERMS)
+    return _sparse_vector({
+        term: count * (BM25_K1 + 1) / (count + length_norm)
+        for term, count in Counter(terms).items()
+    })
+
+
+def bm25_query_vector(text: str) -> models.SparseVector:
+    """every distinct query term counts once, the stored weights and the IDF decide the score"""
+    return _sparse_vector({
+        term: 1. for term in lexical_terms(text) if term not in _STOP_WORDS
+    })
+
+
+class BM25SparseEmbeddings(SparseEmbeddings):
+    """
+    sparse embeddings for the hybrid mode of `QdrantVectorStore`. queries are normalized like the
+    stored chunks, which were normalized before they were split
+    """
+
+    def embed_documents(self, texts: List[str]) -> List[SparseVector]:
+        return [SparseVector(**dict(bm25_document_vector(text))) for text in texts]
+
+    def embed_query(self, text: str) -> SparseVector:
+        return SparseVector(**dict(bm25_query_vector(get_text_normalizer().normalize(text))))
+
+
+__all__ = ["SPARSE_VECTOR_NAME", "lexical_terms", "bm25_document_vector",
+           "bm25_query_vector", "BM25SparseEmbeddings"]
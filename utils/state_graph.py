@@ -1,28 +1,109 @@
 from email import utils
+from functools import lru_cache
 from typing import Callable, Literal, Optional
 from langchain_ollama import ChatOllama
 from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
-from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
 from typing_extensions import TypedDict
 from streamlit_components.session_state import AiThoughtProcess
 from utils.data_formatting import extract_material_ids
-from utils.embeddings import CustomEmbeddings
+from utils.material_properties import extract_property_constraints
 from utils.prompts import *
-from utils.embedding_models import get_matscibert
+from utils.lru_cache import LRUCache
+from utils.resources import LazyResource
 from langchain.prompts import PromptTemplate
-from utils.qdrant_client import get_qdrant_client
+import config
 
 MATERIAL_PROJECT_BASE_URL = "https://next-gen.materialsproject.org/materials"
+MATERIALS_COLLECTION_NAME = "materials"
 
 # region initializing for Qdrant retrieval
-qdrant_client = get_qdrant_client()
-embedding_model = CustomEmbeddings(*get_matscibert())
-vectorstore = QdrantVectorStore(
-    embedding=embedding_model,
-    collection_name="materials",
-    client=qdrant_client
-)
+# torch, transformers and the Qdrant client are imported with the resources that need them,
+# so importing this module stays fast and the model is loaded on first use or by `warm_up_retrieval`
+
+
+def _create_qdrant_client():
+    from utils.qdrant_client import get_qdrant_client
+    return get_qdrant_client()
+
+
+def _create_embedding_model():
+    from utils.embeddings import CustomEmbeddings
+    from utils.embedding_models import get_matscibert
+    from utils.vector_projection import PCAProjection
+    return CustomEmbeddings(
+        *get_matscibert(),
+        query_cache=LRUCache(
+            config.QUERY_EMBEDDING_CACHE_SIZE, config.QUERY_EMBEDDING_CACHE_TTL or None
+        ) if config.QUERY_EMBEDDING_CACHE_SIZE else None,
+        query_batch_size=config.QUERY_BATCH_SIZE,
+        query_batch_wait=config.QUERY_BATCH_MAX_WAIT_MS / 1000,
+        # queries are projected like the stored vectors
+        projection=PCAProjection.load(
+            config.VECTOR_PROJECTION_PATH) if config.VECTOR_PROJECTION_DIM else None
+    )
+
+
+@lru_cache(maxsize=None)
+def _search_params():
+    # rescoring settings for searches over quantized vectors
+    from utils.collection_config import CollectionStorage
+    return CollectionStorage.from_config().search_params()
+
+
+def _create_vectorstore():
+    from langchain_qdrant import QdrantVectorStore, RetrievalMode
+    from utils.collection_config import has_sparse_vectors
+    from utils.sparse_vectors import SPARSE_VECTOR_NAME, BM25SparseEmbeddings
+    vector_size = qdrant_client.get().get_collection(
+        MATERIALS_COLLECTION_NAME).config.params.vectors.size
+    if embedding_model.get().dimension != vector_size:
+        # e.g. VECTOR_PROJECTION_DIM or the projection file do not match the loaded vectors
+        raise ValueError(
+            f"The queries are embedded with {embedding_model.get().dimension} dimensions but the collection "
+            f"holds {vector_size}-dimensional vectors, check VECTOR_PROJECTION_DIM and VECTOR_PROJECTION_PATH.")
+    hybrid_search = config.HYBRID_SEARCH and has_sparse_vectors(
+        qdrant_client.get(), MATERIALS_COLLECTION_NAME)
+    if config.HYBRID_SEARCH and not hybrid_search:
+        print("The collection has no sparse vectors, searching the dense vectors only. "
+              "Rebuild it with `api_data_extractor.py --recreate` for hybrid search.")
+    # hybrid searches run the dense and the sparse search as prefetches of one query and fuse them with RRF
+    return QdrantVectorStore(
+        embedding=embedding_model.get(),
+        collection_name=MATERIALS_COLLECTION_NAME,
+        client=qdrant_client.get(),
+        retrieval_mode=RetrievalMode.HYBRID if hybrid_search else RetrievalMode.DENSE,
+        vector_name="",
+        sparse_embedding=BM25SparseEmbeddings() if hybrid_search else None,
+        sparse_vector_name=SPARSE_VECTOR_NAME
+    )
+
+
+def _create_retrieval_cache():
+    if not config.RETRIEVAL_CACHE_SIZE:
+        return None
+    from utils.retrieval_cache import RetrievalCache, read_collection_version
+    return RetrievalCache(
+        config.RETRIEVAL_CACHE_SIZE,
+        config.RETRIEVAL_CACHE_TTL or None,
+        # re-ingesting the collection writes a new version, which drops the cached results
+        read_version=lambda: read_collection_version(
+            qdrant_client.get(), MATERIALS_COLLECTION_NAME),
+        version_check_interval=config.RETRIEVAL_CACHE_VERSION_CHECK_SECONDS
+    )
+
+
+qdrant_client = LazyResource("Qdrant client", _create_qdrant_client)
+embedding_model = LazyResource("embedding model", _create_embedding_model)
+vectorstore = LazyResource("vector store", _create_vectorstore)
+retrieval_cache = LazyResource("retrieval cache", _create_retrieval_cache)
+
+
+def warm_up_retrieval():
+    """loads the embedding model and connects to Qdrant in the background, ahead of the first query"""
+    embedding_model.warm_up()
+    qdrant_client.warm_up()
+    vectorstore.warm_up()
+    retrieval_cache.warm_up()
 # endregion
 
 
@@ -188,32 +269,47 @@ class MatSciStateGraph:
         self._ai_thought_markdowns.append(status)
         self._status.write(status)
 
+    @staticmethod
+    def __search_documents(search_query, material_ids, constraints, required_data_points):
+        if material_ids:
+            # exact lookup of every chunk of the requested materials, no query embedding or vector search
+            from utils.retrieval import lookup_material_chunks
+            return lookup_material_chunks(
+                qdrant_client.get(), MATERIALS_COLLECTION_NAME, material_ids)
+        from utils.retrieval import property_filter
+        # the vector search only runs over the materials that satisfy the constraints of the question
+        retriever = vectorstore.get().as_retriever(
+            search_kwargs={"k": required_data_points,
+                           "filter": property_filter(constraints),
+                           "search_params": _search_params()}
+        )
+        return retriever.invoke(search_query)
+
     def retrieve_context(self, state):
         self.__update_status(
             label="**Step: Retrieving contexts from the knowledge base**")
         search_query = state["search_query"]
         required_data_points = state["required_data_points"] if "required_data_points" in state else 0
         material_ids = state["material_ids"] if "material_ids" in state else []
+        constraints = [] if material_ids else extract_property_constraints(
+            search_query)
+        if constraints:
+            self.__write_status(
+                f"**Step: Retrieving contexts from the knowledge base:** Filtering on {', '.join(map(str, constraints))}")
 
-        if material_ids:
-            metadata_filter = {
-                "should": [
-                    {
-                        "key": "material_id",
-                        "match": {"value": material_id}
-                    }
-                    for material_id in material_ids
-                ]
-            }
-            retriever = vectorstore.as_retriever(
-                search_kwargs={"filter": metadata_filter, "k": 10}
-            )
-            docs = retriever.invoke("")
+        cache = retrieval_cache.get()
+        cache_key = cache.key(search_query, material_ids, constraints,
+                              required_data_points) if cache is not None else None
+        docs = cache.get(cache_key) if cache is not None else None
+        if docs is not None:
+            self.__write_status(
+                f"**Step: Retrieving contexts from the knowledge base:** Reusing the results of an earlier identical search "
+                f"(retrieval cache hit rate {cache.hit_rate:.0%})")
         else:
-            retriever = vectorstore.as_retriever(
-                search_kwargs={"k": required_data_points}
-            )
-            docs = retriever.invoke(search_query)
+            docs = MatSciStateGraph.__search_documents(
+                search_query, material_ids, constraints, required_data_points)
+            if cache is not None:
+                cache.put(cache_key, docs)
 
         contexts = [doc.page_content for doc in docs]
         self.__write_status(
@@ -0,0 +1,76 @@
+import os
+import pathlib
+from typing import Iterable, List
+from tokenizers.normalizers import BertNormalizer
+
+VOCAB_MAPPINGS_PATH = os.path.join(
+    pathlib.Path(__file__).parent.resolve(), 'vocab_mappings.txt')
+
+
+class _MappingTable(dict):
+    # characters without a mapping are replaced with a space
+    def __missing__(self, key):
+        return ' '
+
+
+class _NormalizationTable(dict):
+    """
+    `str.translate` table holding the fully normalized form of every code point seen so far.
+    a code point is run through the BERT normalizer and the mappings the first time it is
+    looked up, every later occurrence is a plain table lookup
+    """
+
+    def __init__(self, bert_normalizer: BertNormalizer, mapping_table: _MappingTable):
+        # line breaks are kept as they are, everything else is normalized
+        super().__init__({ord('\n'): '\n'})
+        self._bert_normalizer = bert_normalizer
+        self._mapping_table = mapping_table
+
+    def __missing__(self, key):
+        normalized = self._bert_normalizer.normalize_str(
+            chr(key)).translate(self._mapping_table)
+        self[key] = normalized
+        return normalized
+
+
+class TextNormalizer:
+    """
+    MatSciBERT text normalization: BERT normalization (accents stripped, text cleaned) of every line,
+    followed by the character mappings of `vocab_mappings.txt`.
+
+    Every step of that pipeline works on one character at a time (NFD only reorders combining
+    marks, which are either stripped or not part of the mappings), so the whole pipeline is
+    compiled into a single `str.translate` table that is filled in lazily. The mapping file is
+    read once per instance, use `get_text_normalizer` to share one instance per process.
+    """
+
+    def __init__(self, vocab_mappings_path: str = VOCAB_MAPPINGS_PATH):
+        with open(vocab_mappings_path, 'r') as f:
+            mappings = f.read().strip().split('\n')
+        mappings = {m[0]: m[2:] for m in mappings}
+        bert_normalizer = BertNormalizer(lowercase=False, strip_accents=True,
+                                         clean_text=True, handle_chinese_chars=True)
+        self._normalization_table = _NormalizationTable(
+            bert_normalizer,
+            _MappingTable({ord(c): replacement for c,
+                          replacement in mappings.items()})
+        )
+
+    def normalize(self, text: str) -> str:
+        return text.translate(self._normalization_table)
+
+    def normalize_batch(self, texts: Iterable[str]) -> List[str]:
+        return [text.translate(self._normalization_table) for text in texts]
+
+
+_text_normalizer: TextNormalizer = None
+
+
+def get_text_normalizer() -> TextNormalizer:
+    global _text_normalizer
+    if _text_normalizer is None:
+        _text_normalizer = TextNormalizer()
+    return _text_normalizer
+
+
+__all__ = ["TextNormalizer", "get_text_normalizer"]
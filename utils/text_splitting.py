@@ -0,0 +1,77 @@
+import copy
+from typing import List
+from utils.embeddings import MAX_LENGTH
+
+# separator between the property sections of `format_summary_doc` descriptions
+SECTION_SEPARATOR = "; "
+
+
+class SectionTokenSplitter:
+    """
+    Splits `format_summary_doc` descriptions into as few chunks as possible, each of which fits the
+    model window once the special tokens are added.
+
+    Chunks are built from whole "; "-separated property sections, counted with the model tokenizer.
+    The BERT pre-tokenizer splits on whitespace and punctuation, so the token count of sections joined
+    by "; " is the sum of their counts plus one separator each. A section that is longer than the window
+    on its own becomes chunks of its own, cut between words.
+    """
+
+    def __init__(self, tokenizer, max_length: int = MAX_LENGTH, separator: str = SECTION_SEPARATOR):
+        # the splitter runs in a pipeline thread next to the model, and a fast tokenizer
+        # cannot be used by two threads at once
+        self._tokenizer = copy.deepcopy(tokenizer)
+        self._separator = separator
+        # room for [CLS] and [SEP]
+        self._max_tokens = max_length - tokenizer.num_special_tokens_to_add()
+        self._separator_tokens = len(tokenizer(
+            separator, add_special_tokens=False)["input_ids"])
+
+    def _split_long_section(self, section: str) -> List[str]:
+        encoding = self._tokenizer(
+            section, add_special_tokens=False, return_offsets_mapping=True)
+        offsets = encoding["offset_mapping"]
+        word_ids = encoding.word_ids()
+        pieces = []
+        start_idx = 0
+        while start_idx < len(offsets):
+            end_idx = min(start_idx + self._max_tokens, len(offsets))
+            # step back to the start of the word that would be cut, unless the word fills the window by itself
+            cut_idx = end_idx
+            while end_idx < len(offsets) and cut_idx > start_idx and word_ids[cut_idx] == word_ids[cut_idx - 1]:
+                cut_idx -= 1
+            end_idx = cut_idx if cut_idx > start_idx else end_idx
+            pieces.append(section[offsets[start_idx][0]:offsets[end_idx - 1][1]])
+            start_idx = end_idx
+        return pieces
+
+    def split_text(self, text: str) -> List[str]:
+        sections = [section for section in text.split(
+            self._separator) if section.strip()]
+        if not sections:
+            return []
+        token_counts = [len(input_ids) for input_ids in self._tokenizer(
+            sections, add_special_tokens=False)["input_ids"]]
+        chunks = []
+        chunk_sections = []
+        chunk_tokens = 0
+        for section, token_count in zip(sections, token_counts):
+            if chunk_sections and chunk_tokens + self._separator_tokens + token_count <= self._max_tokens:
+                chunk_sections.append(section)
+                chunk_tokens += self._separator_tokens + token_count
+                continue
+            if chunk_sections:
+                chunks.append(self._separator.join(chunk_sections))
+            if token_count <= self._max_tokens:
+                chunk_sections = [section]
+                chunk_tokens = token_count
+            else:
+                chunks.extend(self._split_long_section(section))
+                chunk_sections = []
+                chunk_tokens = 0
+        if chunk_sections:
+            chunks.append(self._separator.join(chunk_sections))
+        return chunks
+
+
+__all__ = ["SectionTokenSplitter", "SECTION_SEPARATOR"]
@@ -0,0 +1,66 @@
+from datetime import datetime
+import hashlib
+import numpy as np
+from utils.atomic_files import atomic_output_path
+
+
+class PCAProjection:
+    """
+    Linear projection of embeddings onto their top principal components, fitted once on a sample.
+
+    The same fitted projection has to be applied to the stored chunk embeddings and to the queries,
+    it is saved as an .npz file next to the collection data.
+    """
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, explained_variance_ratio: np.ndarray):
+        self._mean = np.asarray(mean, dtype=np.float32)
+        # (dimension, input dimension), one principal axis per row
+        self._components = np.asarray(components, dtype=np.float32)
+        self._explained_variance_ratio = np.asarray(
+            explained_variance_ratio, dtype=np.float32)
+
+    @staticmethod
+    def fit(embeddings: np.ndarray, dimension: int) -> "PCAProjection":
+        embeddings = np.asarray(embeddings, dtype=np.float64)
+        assert dimension <= min(embeddings.shape), \
+            f"cannot fit {dimension} components on {embeddings.shape[0]} samples of size {embeddings.shape[1]}"
+        mean = embeddings.mean(axis=0)
+        _, singular_values, components = np.linalg.svd(
+            embeddings - mean, full_matrices=False)
+        variances = singular_values ** 2
+        return PCAProjection(mean, components[:dimension], variances[:dimension] / variances.sum())
+
+    @property
+    def dimension(self) -> int:
+        return self._components.shape[0]
+
+    @property
+    def explained_variance(self) -> float:
+        """share of the sample variance kept by the projection"""
+        return float(self._explained_variance_ratio.sum())
+
+    @property
+    def fingerprint(self) -> str:
+        """identifies the fitted projection, vectors projected with different fits are not comparable"""
+        digest = hashlib.sha1(self._mean.tobytes())
+        digest.update(self._components.tobytes())
+        return digest.hexdigest()[:12]
+
+    def transform(self, embeddings: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray((embeddings - self._mean) @ self._components.T, dtype=np.float32)
+
+    def save(self, path: str):
+        # np.savez appends .npz to paths without it
+        with atomic_output_path(path, suffix=".tmp.npz") as tmp_path:
+            np.savez(tmp_path, mean=self._mean, components=self._components,
+                     explained_variance_ratio=self._explained_variance_ratio)
+        print(f"{datetime.now()}: saved {self.dimension}-dimensional projection "
+              f"({self.explained_variance:.1%} of the variance) to {path}")
+
+    @staticmethod
+    def load(path: str) -> "PCAProjection":
+        with np.load(path) as arrays:
+            return PCAProjection(arrays["mean"], arrays["components"], arrays["explained_variance_ratio"])
+
+
+__all__ = ["PCAProjection"]
@@ -0,0 +1,249 @@
+from datetime import datetime
+import json
+import mmap
+import os
+from typing import Generator, Iterable, List, Optional, Tuple
+import numpy as np
+from qdrant_client import QdrantClient, models
+from utils.collection_config import stale_chunk_filter
+from utils.material_properties import BOOLEAN_PROPERTIES, NUMERIC_PROPERTIES
+from utils.sparse_vectors import SPARSE_VECTOR_NAME, bm25_document_vector
+from utils.vector_projection import PCAProjection
+
+# snapshot layout, all rows are aligned by index:
+#   vectors.npy       float32 matrix (n, dim), can be memory-mapped
+#   payload.npy       structured array with the point id, material id, chunk index, chunk count of the material,
+#                     page_content offset/length and the material properties (NaN for missing numbers, -1 for missing booleans)
+#   page_content.bin  utf-8 encoded page contents, back to back
+#   meta.json         vector size and row count
+#   projection.npz    the projection the vectors were reduced with, only with VECTOR_PROJECTION_DIM
+VECTORS_FILE_NAME = "vectors.npy"
+PAYLOAD_FILE_NAME = "payload.npy"
+PAGE_CONTENT_FILE_NAME = "page_content.bin"
+META_FILE_NAME = "meta.json"
+PROJECTION_FILE_NAME = "projection.npz"
+
+PAYLOAD_DTYPE = np.dtype([
+    ("id", "S36"),
+    ("material_id", "S32"),
+    ("chunk_idx", "<i4"),
+    ("chunk_count", "<i4"),
+    ("offset", "<i8"),
+    ("length", "<i8"),
+    *((key, "<f8") for key in NUMERIC_PROPERTIES),
+    *((key, "i1") for key in BOOLEAN_PROPERTIES),
+])
+
+
+class _NpyAppender:
+    """
+    writes an .npy file whose row count is not known up front. numpy pads the header so that
+    the first dimension of the shape can grow in place, the header is rewritten on close
+    """
+
+    def __init__(self, path: str, dtype: np.dtype, row_shape: Tuple[int, ...] = ()):
+        self._file = open(path, "wb")
+        self._dtype = np.dtype(dtype)
+        self._row_shape = row_shape
+        self._rows = 0
+        self._header_length = self._write_header()
+
+    def _write_header(self) -> int:
+        self._file.seek(0)
+        np.lib.format.write_array_header_1_0(self._file, {
+            "descr": np.lib.format.dtype_to_descr(self._dtype),
+            "fortran_order": False,
+            "shape": (self._rows, *self._row_shape),
+        })
+        return self._file.tell()
+
+    def append(self, rows: np.ndarray):
+        rows = np.ascontiguousarray(rows, dtype=self._dtype)
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(rows.tobytes())
+        self._rows += len(rows)
+
+    def close(self) -> int:
+        assert self._write_header() == self._header_length, "npy header grew while appending"
+        self._file.close()
+        return self._rows
+
+
+class VectorSnapshotWriter:
+    def __init__(self, directory: str, vector_size: int = 768, projection: Optional[PCAProjection] = None):
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        # queries are projected like the stored vectors, so the projection travels with them
+        projection_path = os.path.join(directory, PROJECTION_FILE_NAME)
+        if projection is not None:
+            projection.save(projection_path)
+        elif os.path.exists(projection_path):
+            os.remove(projection_path)
+        self._vector_size = vector_size
+        self._vectors = _NpyAppender(os.path.join(
+            directory, VECTORS_FILE_NAME), np.float32, (vector_size,))
+        self._payload = _NpyAppender(os.path.join(
+            directory, PAYLOAD_FILE_NAME), PAYLOAD_DTYPE)
+        self._page_content = open(os.path.join(
+            directory, PAGE_CONTENT_FILE_NAME), "wb")
+        self._offset = 0
+
+    def write(self, batch: List[Tuple[str, str, int, int, str, dict]], embeddings):
+        """`batch` holds (point_id, material_id, chunk_idx, chunk_count, description_chunk, properties) tuples aligned with `embeddings`"""
+        payload = np.empty(len(batch), dtype=PAYLOAD_DTYPE)
+        for idx, (point_id, material_id, chunk_idx, chunk_count, description_chunk, properties) in enumerate(batch):
+            encoded_chunk = description_chunk.encode("utf-8")
+            payload[idx] = (
+                point_id.encode("ascii"), material_id.encode("utf-8"), chunk_idx, chunk_count,
+                self._offset, len(encoded_chunk),
+                *(properties.get(key, np.nan) for key in NUMERIC_PROPERTIES),
+                *(int(properties.get(key, -1)) for key in BOOLEAN_PROPERTIES)
+            )
+            self._page_content.write(encoded_chunk)
+            self._offset += len(encoded_chunk)
+        self._vectors.append(embeddings)
+        self._payload.append(payload)
+
+    def close(self):
+        rows = self._vectors.close()
+        assert self._payload.close() == rows
+        self._page_content.close()
+        with open(os.path.join(self._directory, META_FILE_NAME), "w") as f:
+            json.dump({"vector_size": self._vector_size, "rows": rows}, f)
+        print(f"{datetime.now()}: wrote {rows} vectors to {self._directory}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def export_vector_snapshot(
+    embedded_batches: Iterable,
+    directory: str,
+    vector_size: int = 768,
+    projection: Optional[PCAProjection] = None
+):
+    """writes the (key, batch, embeddings) items produced by `ingestion.stream_embedded_batches` to `directory`"""
+    with VectorSnapshotWriter(directory, vector_size, projection) as writer:
+        for _, batch, batch_embeddings in embedded_batches:
+            writer.write(batch, batch_embeddings)
+
+
+def read_vector_snapshot(directory: str) -> Tuple[np.ndarray, np.ndarray, mmap.mmap]:
+    """memory-maps the vectors, payload and page contents of the snapshot in `directory`"""
+    vectors = np.load(os.path.join(
+        directory, VECTORS_FILE_NAME), mmap_mode="r")
+    payload = np.load(os.path.join(
+        directory, PAYLOAD_FILE_NAME), mmap_mode="r")
+    with open(os.path.join(directory, PAGE_CONTENT_FILE_NAME), "rb") as f:
+        # mmap cannot map an empty file
+        page_content = mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+    return vectors, payload, page_content
+
+
+def read_snapshot_projection(directory: str) -> Optional[PCAProjection]:
+    """the projection the vectors of the snapshot in `directory` were reduced with, None when it holds no projection"""
+    projection_path = os.path.join(directory, PROJECTION_FILE_NAME)
+    return PCAProjection.load(projection_path) if os.path.exists(projection_path) else None
+
+
+def cosine_top_k(vectors: np.ndarray, queries: np.ndarray, k: int, block_size: int = 65536) -> np.ndarray:
+    """row indexes of the `k` most cosine-similar `vectors` of every query, scanning `vectors` in blocks so a memory map is never fully loaded"""
+    normalized_queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    top_scores = np.empty((len(queries), 0), dtype=np.float32)
+    top_idxs = np.empty((len(queries), 0), dtype=np.int64)
+    for start_idx in range(0, len(vectors), block_size):
+        block = np.asarray(vectors[start_idx:start_idx + block_size], dtype=np.float32)
+        candidate_scores = np.concatenate([top_scores, normalized_queries @ (
+            block / np.linalg.norm(block, axis=1, keepdims=True)).T], axis=1)
+        candidate_idxs = np.concatenate([top_idxs, np.broadcast_to(
+            np.arange(start_idx, start_idx + len(block)), (len(queries), len(block)))], axis=1)
+        keep = np.argsort(-candidate_scores, axis=1)[:, :k]
+        top_scores = np.take_along_axis(candidate_scores, keep, axis=1)
+        top_idxs = np.take_along_axis(candidate_idxs, keep, axis=1)
+    return top_idxs
+
+
+def _iter_payload(payload: np.ndarray, page_content) -> Generator[dict, None, None]:
+    # snapshots written before the chunk index and the properties were added hold none of them
+    has_chunk_idx = "chunk_idx" in payload.dtype.names
+    numeric_keys = [key for key in NUMERIC_PROPERTIES if key in payload.dtype.names]
+    boolean_keys = [key for key in BOOLEAN_PROPERTIES if key in payload.dtype.names]
+    for record in payload:
+        offset, length = int(record["offset"]), int(record["length"])
+        yield {
+            "material_id": record["material_id"].decode("utf-8"),
+            **({"chunk_idx": int(record["chunk_idx"])} if has_chunk_idx else {}),
+            "page_content": page_content[offset:offset + length].decode("utf-8"),
+            **{key: float(record[key]) for key in numeric_keys if not np.isnan(record[key])},
+            **{key: bool(record[key]) for key in boolean_keys if record[key] >= 0}
+        }
+
+
+def _iter_named_vectors(vectors: np.ndarray, payload: np.ndarray, page_content, batch_size: int) -> Generator[dict, None, None]:
+    # the dense vectors are read from the memory map and converted one batch slice at a time, as
+    # `upload_collection` does with a plain array. the sparse vectors are not part of the snapshot,
+    # they are computed from the page contents
+    for start_idx in range(0, len(vectors), batch_size):
+        records = payload[start_idx:start_idx + batch_size]
+        for dense_vector, record in zip(vectors[start_idx:start_idx + batch_size].tolist(), records):
+            offset, length = int(record["offset"]), int(record["length"])
+            yield {
+                "": dense_vector,
+                SPARSE_VECTOR_NAME: bm25_document_vector(
+                    page_content[offset:offset + length].decode("utf-8"))
+            }
+
+
+def load_vector_snapshot(
+    directory: str,
+    qdrant_client: QdrantClient,
+    collection_name: str,
+    batch_size: int = 256,
+    parallel: int = 4,
+    sparse_vectors: bool = True
+):
+    """
+    streams the snapshot in `directory` into an existing collection, the vectors are sent straight from
+    the memory map. with `sparse_vectors`, the BM25 vectors of hybrid search are sent along with them.
+    the chunks stored before for the loaded materials and not part of the snapshot are deleted afterwards
+    """
+    vectors, payload, page_content = read_vector_snapshot(directory)
+    qdrant_client.upload_collection(
+        collection_name=collection_name,
+        vectors=_iter_named_vectors(
+            vectors, payload, page_content, batch_size) if sparse_vectors else vectors,
+        payload=_iter_payload(payload, page_content),
+        ids=(point_id.decode("ascii") for point_id in payload["id"]),
+        batch_size=batch_size,
+        parallel=parallel,
+        wait=True
+    )
+    print(f"{datetime.now()}: loaded {len(vectors)} vectors from {directory} into {collection_name}")
+    delete_stale_chunks(payload, qdrant_client, collection_name, batch_size)
+
+
+def delete_stale_chunks(payload: np.ndarray, qdrant_client: QdrantClient, collection_name: str, batch_size: int = 256):
+    """deletes the points of the materials in `payload` left over from their previous ingestions"""
+    if "chunk_count" not in payload.dtype.names:
+        print(f"{datetime.now()}: the snapshot holds no chunk counts, outdated chunks are kept in {collection_name}")
+        return
+    for start_idx in range(0, len(payload), batch_size):
+        records = payload[start_idx:start_idx + batch_size]
+        qdrant_client.delete(
+            collection_name=collection_name,
+            points_selector=models.FilterSelector(filter=stale_chunk_filter(
+                (point_id.decode("ascii"), material_id.decode("utf-8"), int(chunk_idx), int(chunk_count))
+                for point_id, material_id, chunk_idx, chunk_count
+                in records[["id", "material_id", "chunk_idx", "chunk_count"]]
+            )),
+            # updates are applied in order, once the last delete is applied every other one is
+            wait=start_idx + batch_size >= len(payload)
+        )
+
+
+__all__ = ["VectorSnapshotWriter", "export_vector_snapshot",
+           "read_vector_snapshot", "read_snapshot_projection", "load_vector_snapshot", "delete_stale_chunks", "cosine_top_k"]